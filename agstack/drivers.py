@@ -1,6 +1,7 @@
 '''
 Utilities for creating consistent model driver data. The common format for
-raw driver data is a (P x N x T) data cube of P raw fields, in order:
+raw driver data is a (P x N x T) data cube of P raw fields, stored field-major
+(i.e., a C-contiguous array), in order:
 
     Abbreviation    Description
     ------------    -----------
@@ -16,9 +17,15 @@ raw driver data is a (P x N x T) data cube of P raw fields, in order:
 '''
 
 import numpy as np
+from agstack import kernels
 
+# The fraction of downwelling short-wave radiation that is PAR (0.45), and the
+#   conversion from [W m-2] to [MJ m-2 day-1]; 11.5741 is derived as
+#   1 / ((60 secs * 60 mins * 24 hrs) / 1e6), given that 1 W == 1 J sec-1
+PAR_SCALE = 0.45 / 11.5741
 
-def drivers_for_tcf(drivers: np.ndarray) -> np.ndarray:
+
+def drivers_for_tcf(drivers: np.ndarray, validate: bool = True) -> np.ndarray:
     '''
     Generates a drivers data cube for TCF, which expects the following
     drivers, in order (i.e., these are the output fields of this function):
@@ -36,33 +43,56 @@ def drivers_for_tcf(drivers: np.ndarray) -> np.ndarray:
     ----------
     drivers : numpy.ndarray
         Input raw driver datasets, either a (P x N x T) array or a (P x T)
-        array of P driver fields, N pixels, and T time steps
+        array of P driver fields, N pixels, and T time steps; for the best
+        performance, it should be C-contiguous (i.e., field-major), so that
+        each field is a contiguous (N x T) plane in memory
+    validate : bool
+        True to check that soil moisture and temperature fields are within
+        plausible bounds (Default); this takes two passes over each of those
+        fields, so it can be skipped for drivers that are known to be valid
 
     Returns
     -------
     numpy.ndarray
     '''
     fpar, swrad, tmean, qv2m, ps, tmin, smrz, tsoil, smsf = drivers
-    assert np.nanmin(smrz) >= 0 and np.nanmax(smrz) <= 1,\
-        'Surface soil moisture (SMSF) is not bounded by [0,1]'
-    assert np.nanmin(smrz) >= 0 and np.nanmax(smrz) <= 1,\
-        'Root-zone soil moisture (SMRZ) is not bounded by [0,1]'
-    assert np.nanmin(tmin) >= 200 and np.nanmax(smrz) <= 320,\
-        'Minimum temperature is probably not in deg K; should be bounded [200,320]'
-    assert np.nanmin(tmean) >= 200 and np.nanmax(tmean) <= 320,\
-        'Mean temperature is probably not in deg K; should be bounded [200,320]'
-    par = par_from_shortwave(swrad)
-    vpd = vapor_pressure_deficit(qv2m, ps, tmean)
-    ft = np.where(tmin < 0, 0, 1)
-    result = np.stack([
-        fpar, par, tmin, vpd, smrz, ft, tsoil, smsf
-    ], axis = 0)
+    if validate:
+        assert np.nanmin(smsf) >= 0 and np.nanmax(smsf) <= 1,\
+            'Surface soil moisture (SMSF) is not bounded by [0,1]'
+        assert np.nanmin(smrz) >= 0 and np.nanmax(smrz) <= 1,\
+            'Root-zone soil moisture (SMRZ) is not bounded by [0,1]'
+        assert np.nanmin(tmin) >= 200 and np.nanmax(tmin) <= 320,\
+            'Minimum temperature is probably not in deg K; should be bounded [200,320]'
+        assert np.nanmin(tmean) >= 200 and np.nanmax(tmean) <= 320,\
+            'Mean temperature is probably not in deg K; should be bounded [200,320]'
+    # Each output field is written directly into the (floating-point) data
+    #   cube, rather than being computed separately and stacked
+    result = np.empty((8, *fpar.shape), dtype = np.result_type(drivers, 1.0))
+    if kernels.HAS_NUMBA:
+        # All output fields are computed in a single pass over the drivers
+        if result.ndim == 2:
+            kernels.tcf_drivers(
+                drivers[:,np.newaxis], PAR_SCALE, result[:,np.newaxis])
+            return result[:,np.newaxis,:]
+        kernels.tcf_drivers(drivers, PAR_SCALE, result)
+        return result
+    result[0] = fpar
+    par_from_shortwave(swrad, out = result[1])
+    result[2] = tmin
+    vapor_pressure_deficit(qv2m, ps, tmean, out = result[3])
+    result[4] = smrz
+    # FT state is 0 (frozen) where Tmin < 0, otherwise 1 (including where
+    #   Tmin is NaN), computed from the comparison itself, in place
+    np.less(tmin, 0, out = result[5])
+    np.subtract(1, result[5], out = result[5])
+    result[6] = tsoil
+    result[7] = smsf
     if result.ndim == 2:
         return result[:,np.newaxis,:]
     return result
 
 
-def par_from_shortwave(swrad):
+def par_from_shortwave(swrad, out: np.ndarray = None):
     '''
     Photosynthetically active radiation (PAR), as a fraction of downwelling
     short-wave radiation (MERRA-2 SWGDN); after calculating the portion of
@@ -71,18 +101,20 @@ def par_from_shortwave(swrad):
     Parameters
     ----------
     swrad : Number or numpy.ndarray
+    out : numpy.ndarray or None
+        (Optional) An array, of the same shape as `swrad`, in which to store
+        the result
 
     Returns
     -------
     numpy.ndarray
     '''
-    # Take 24-hour mean of SWGDN, then convert from W m-2 to MJ m-2 day-1;
-    # 11.5741 is derived as 1 / ((60 secs * 60 mins * 24 hrs) / 1e6),
-    #   given that 1 W == 1 J sec-1
-    return np.divide(np.multiply(0.45, swrad), 11.5741)
+    # Take 24-hour mean of SWGDN, then convert from W m-2 to MJ m-2 day-1,
+    #   in a single multiplication; see PAR_SCALE
+    return np.multiply(swrad, PAR_SCALE, out = out)
 
 
-def vapor_pressure_deficit(qv2m, ps, temp_k):
+def vapor_pressure_deficit(qv2m, ps, temp_k, out: np.ndarray = None):
 	r'''
     Calculates vapor pressure deficit (VPD).
 
@@ -117,14 +149,40 @@ def vapor_pressure_deficit(qv2m, ps, temp_k):
         The surface pressure, in Pascals
     temp_k : numpy.ndarray or float
         The temperature at 2-m height in degrees Kelvin
+    out : numpy.ndarray or None
+        (Optional) An array, of the broadcast shape of the inputs, in which
+        to store the result
 
     Returns
     -------
     numpy.ndarray or float
         VPD in Pascals
     '''
-	temp_c = temp_k - 273.15 # Convert temperature to degrees C
-	avp = np.divide(np.multiply(qv2m, ps), 0.622 + (0.378 * qv2m))
-	x = np.divide(17.38 * temp_c, (239 + temp_c))
-	esat = 610.7 * np.exp(x)
-	return np.subtract(esat, avp)
+	if kernels.HAS_NUMBA:
+		# A compiled ufunc computes the result in a single pass, without any
+		#   temporary arrays; NaNs in the drivers are expected, so the (FP
+		#   status) warnings they raise are ignored
+		with np.errstate(invalid = 'ignore'):
+			return kernels.vapor_pressure_deficit(qv2m, ps, temp_k, out = out)
+	# The result and the actual vapor pressure (AVP) are the only arrays
+	#   allocated, as every step is computed in place; they have the broadcast
+	#   shape of the inputs (and are 0D arrays for scalar inputs)
+	shape = np.broadcast(qv2m, ps, temp_k).shape
+	vpd = out
+	if vpd is None:
+		vpd = np.empty(shape, np.result_type(qv2m, ps, temp_k, 1.0))
+	avp = np.empty_like(vpd)
+	# Saturation vapor pressure; with T in degrees C, the exponent is
+	#   rearranged as: 17.38 T / (239 + T) == 17.38 - (17.38 * 239) / (239 + T)
+	#   where (239 + T) == (T_K - 34.15), so it takes one division, not two
+	np.subtract(temp_k, 34.15, out = vpd)
+	np.divide(-4153.82, vpd, out = vpd)
+	vpd += 17.38
+	np.exp(vpd, out = vpd)
+	vpd *= 610.7
+	np.multiply(0.378, qv2m, out = avp)
+	avp += 0.622
+	np.divide(qv2m, avp, out = avp)
+	avp *= ps
+	vpd -= avp
+	return vpd if vpd.ndim > 0 else vpd[()]
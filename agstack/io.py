@@ -4,13 +4,14 @@ parameter tables.
 '''
 
 import csv
-import datetime
 import json
 import numpy as np
 from typing import Sequence
 
 
-def drivers_from_csv(file_path: str, fields_diff: Sequence = None) -> tuple:
+def drivers_from_csv(
+        file_path: str, fields_diff: Sequence = None,
+        dtype: np.dtype = np.float32) -> tuple:
     '''
     For a single-site time series, read driver data in from a CSV file. Each
     row should be a time step for a single site.
@@ -20,7 +21,12 @@ def drivers_from_csv(file_path: str, fields_diff: Sequence = None) -> tuple:
     file_path : str
         The input file path
     fields_diff : Sequence
-        Do not use
+        Do not use; retained for backwards compatibility, as any of the
+        expected fields that are not in the file are filled with NaN
+    dtype : numpy.dtype or type
+        The floating-point type of the returned drivers (Default:
+        `numpy.float32`, the precision at which `TCF` runs by default); the
+        float32 driver cube is half the size of a float64 one
 
     Returns
     -------
@@ -29,38 +35,31 @@ def drivers_from_csv(file_path: str, fields_diff: Sequence = None) -> tuple:
         NumPy array of shape (P x T)
     '''
     expected = ['fpar', 'swrad', 'tmean', 'qv2m', 'ps', 'tmin', 'smrz', 'tsoil', 'smsf']
-    # To facilitate testing and some edge cases, allow (advanced) user to
-    #   specify which fields might not be available
-    fields = list(expected)
-    if fields_diff is not None:
-        fields = list(set(expected).difference(fields_diff))
-    header = ('', 'date', *fields)
-    drivers = []
-    dates = []
     with open(file_path, 'r') as file:
-        reader = csv.DictReader(file)
-        for line in reader:
-            if reader.line_num == 1:
-                assert all([(col in header) for col in line])
-                continue
-            record = []
-            if 'date' in line.keys():
-                # Try to figure out the date-time format
-                if len(dates) == 0:
-                    for format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
-                        try:
-                            datetime.datetime.strptime(line['date'], format)
-                            break
-                        except ValueError:
-                            continue
-                dates.append(datetime.datetime.strptime(line['date'], format))
-            for key in expected:
-                if key in line.keys():
-                    record.append(float(line[key]))
-                else:
-                    record.append(np.nan)
-            drivers.append(record)
-    return (np.array(drivers).swapaxes(0, 1), np.array(dates))
+        reader = csv.reader(file)
+        columns = next(reader)
+        rows = list(reader)
+    dates = []
+    if 'date' in columns:
+        column = columns.index('date')
+        # Dates are expected in ISO 8601 format, either "%Y-%m-%d" or
+        #   "%Y-%m-%dT%H:%M:%S", which NumPy parses (in C) all at once; they
+        #   are returned as datetime.datetime instances
+        dates = np.array([row[column] for row in rows], dtype = 'datetime64[s]')\
+            .astype(object)
+    # The text of each column is converted to floating-point by NumPy, in a
+    #   single call, rather than by calling float() on each value; fields
+    #   that are not in the file are NaN
+    table = dict(zip(columns, zip(*rows)))
+    # The (P x T) output is allocated once, in its final layout, and each
+    #   element is written only once
+    drivers = np.empty((len(expected), len(rows)), dtype = dtype)
+    for p, key in enumerate(expected):
+        if key in table:
+            drivers[p] = table[key]
+        else:
+            drivers[p] = np.nan
+    return (drivers, np.array(dates))
 
 
 def params_dict_from_json(file_path: str, **kwargs) -> dict:
@@ -89,6 +88,29 @@ def params_dict_from_json(file_path: str, **kwargs) -> dict:
     return result
 
 
+def params_dict_from_npz(file_path: str) -> dict:
+    '''
+    Reads a parameter dictionary from a NumPy (binary) archive, as written by
+    `params_dict_to_npz()`.
+
+    Parameters
+    ----------
+    file_path : str
+        The input file path
+
+    Returns
+    -------
+    dict
+    '''
+    result = dict()
+    with np.load(file_path, allow_pickle = False) as archive:
+        for key in archive.files:
+            value = archive[key]
+            # Scalars (e.g., the "_version" string) are stored as 0-D arrays
+            result[key] = value if value.ndim > 0 else value.item()
+    return result
+
+
 def params_dict_to_json(params: dict, file_path: str, **kwargs):
     '''
     Writes a parameter dictionary (e.g., as from
@@ -107,10 +129,27 @@ def params_dict_to_json(params: dict, file_path: str, **kwargs):
     result = dict()
     for key, value in params.items():
         if key == 'decay_rates':
-            result[key] = [np.array(v).round(6).tolist() for v in value.tolist()]
+            result[key] = np.round(value, 6).tolist()
         elif hasattr(value, 'tolist'):
-            result[key] = [np.array(v).round(3).tolist() for v in value.tolist()]
+            result[key] = np.round(value, 3).tolist()
         else:
             result[key] = value
     with open(file_path, 'w') as file:
         json.dump(result, file, **kwargs)
+
+
+def params_dict_to_npz(params: dict, file_path: str):
+    '''
+    Writes a parameter dictionary to a compressed NumPy (binary) archive.
+    Unlike `params_dict_to_json()`, parameter arrays are written as they are,
+    without converting (or rounding) each element as a Python object; use
+    this for large parameter tables that need not be human-readable.
+
+    Parameters
+    ----------
+    params : dict
+        A dictionary of model parameters
+    file_path : str
+        The output file path; NumPy adds a ".npz" extension if there is none
+    '''
+    np.savez_compressed(file_path, **params)
@@ -0,0 +1,532 @@
+'''
+Compiled kernels for the hot loops of the carbon flux model(s).
+
+These depend on `numba`, which is an optional dependency. If `numba` is not
+installed, the functions here are left as plain (and slow) Python and
+`HAS_NUMBA` is `False`; callers should then fall back on their vectorized
+NumPy implementations. The pure-Python versions remain useful as readable
+references for the compiled code.
+'''
+
+import functools
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAS_NUMBA = numba is not None
+
+# All of LLVM's "fast math" flags except "nnan" and "ninf": NaNs in the
+#   driver data are expected and must propagate (or be guarded against)
+#   exactly as they would in the NumPy implementation
+FASTMATH = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+prange = numba.prange if HAS_NUMBA else range
+
+# Scale factor of the log-transform of root-zone soil moisture (SMRZ)
+SMRZ_LOG_SCALE = 0.95 / math.log(101)
+
+
+def jit(**options):
+    '''
+    Compiles the decorated function with `numba.njit()`, if `numba` is
+    available; otherwise, returns the function unchanged.
+
+    Parameters
+    ----------
+    **options
+        Keyword arguments to `numba.njit()`
+
+    Returns
+    -------
+    function
+    '''
+    def decorator(func):
+        if not HAS_NUMBA:
+            return func
+        return numba.njit(**options)(func)
+    return decorator
+
+
+def vectorize(signatures, **options):
+    '''
+    Compiles the decorated (scalar) function as a NumPy ufunc with
+    `numba.vectorize()`, if `numba` is available; otherwise, returns the
+    function wrapped by `numpy.vectorize()`, which (like a ufunc) accepts
+    arrays and an `out` argument.
+
+    Parameters
+    ----------
+    signatures : list
+        The type signatures to compile, e.g., `['float32(float32)']`
+    **options
+        Keyword arguments to `numba.vectorize()`
+
+    Returns
+    -------
+    function
+    '''
+    def decorator(func):
+        if not HAS_NUMBA:
+            vectorized = np.vectorize(func, otypes = [float])
+            @functools.wraps(func)
+            def wrapper(*args, out = None):
+                if out is None:
+                    return vectorized(*args)
+                out[...] = vectorized(*args)
+                return out
+            return wrapper
+        return numba.vectorize(signatures, **options)(func)
+    return decorator
+
+
+@vectorize([
+    'float32(float32, float32, float32, float32)',
+    'float64(float64, float64, float64, float64)'
+], target = 'parallel', cache = True)
+def arrhenius(tsoil, beta0, beta1, beta2):
+    '''
+    The Arrhenius function of soil temperature, constrained to [0, 1]; see
+    `agstack.utils.arrhenius()`.
+    '''
+    y = math.exp(beta0 * ((1.0 / beta1) - (1.0 / (tsoil - beta2))))
+    if y > 1:
+        return 1
+    if y < 0:
+        return 0
+    return y
+
+
+@jit(cache = True)
+def linear_ramp(x, xmin, xmax):
+    '''
+    The (increasing) linear ramp function on [0, 1], for a scalar `x`; see
+    `agstack.utils.linear_constraint()`.
+    '''
+    if x >= xmax:
+        return 1
+    if x < xmin:
+        return 0
+    return (x - xmin) / (xmax - xmin)
+
+
+@jit(cache = True)
+def linear_ramp_reversed(x, xmin, xmax):
+    '''
+    The "reversed" (decreasing) linear ramp function on [0, 1], for a
+    scalar `x`; see `agstack.utils.linear_constraint()`.
+    '''
+    if x >= xmax:
+        return 0
+    if x < xmin:
+        return 1
+    return 1 - ((x - xmin) / (xmax - xmin))
+
+
+@vectorize([
+    'float32(float32, float32, float32)',
+    'float64(float64, float64, float64)'
+], target = 'parallel', cache = True)
+def ramp(x, xmin, xmax):
+    '''
+    The (increasing) linear ramp function on [0, 1], as a ufunc.
+    '''
+    return linear_ramp(x, xmin, xmax)
+
+
+@vectorize([
+    'float32(float32, float32, float32)',
+    'float64(float64, float64, float64)'
+], target = 'parallel', cache = True)
+def ramp_reversed(x, xmin, xmax):
+    '''
+    The "reversed" (decreasing) linear ramp function on [0, 1], as a
+    ufunc.
+    '''
+    return linear_ramp_reversed(x, xmin, xmax)
+
+
+@jit(inline = 'always')
+def vpd_value(qv2m, ps, temp_k, dtype):
+    '''
+    Vapor pressure deficit (VPD) of a single value, where `dtype` is the
+    floating-point type of the constants; see `vapor_pressure_deficit()`.
+    '''
+    esat = dtype(610.7) * math.exp(
+        dtype(17.38) - dtype(4153.82) / (temp_k - dtype(34.15)))
+    return esat - (qv2m / (dtype(0.622) + dtype(0.378) * qv2m)) * ps
+
+
+@vectorize([
+    'float32(float32, float32, float32)',
+    'float64(float64, float64, float64)'
+], target = 'parallel', fastmath = FASTMATH, cache = True)
+def vapor_pressure_deficit(qv2m, ps, temp_k):
+    '''
+    Vapor pressure deficit (VPD), as a ufunc; see
+    `agstack.drivers.vapor_pressure_deficit()`.
+    '''
+    # Constants are of the same (floating-point) type as the inputs, so
+    #   that float32 data are not promoted to float64
+    return vpd_value(qv2m, ps, temp_k, type(temp_k))
+
+
+@jit(parallel = True, fastmath = FASTMATH, cache = True)
+def tcf_drivers(drivers, par_scale, out):
+    '''
+    Generates the TCF drivers data cube from the raw drivers in a single
+    pass, reading each raw field and writing each output field only once;
+    see `agstack.drivers.drivers_for_tcf()`.
+
+    Parameters
+    ----------
+    drivers : numpy.ndarray
+        (P x N x T) array of the raw driver fields
+    par_scale : float
+        The conversion from short-wave radiation to PAR; see
+        `agstack.drivers.PAR_SCALE`
+    out : numpy.ndarray
+        (8 x N x T) output array for the TCF drivers
+    '''
+    dtype = out.dtype.type
+    zero = dtype(0)
+    one = dtype(1)
+    par_scale = dtype(par_scale)
+    for i in prange(drivers.shape[1]):
+        for t in range(drivers.shape[2]):
+            tmin = drivers[5,i,t]
+            out[0,i,t] = drivers[0,i,t]
+            out[1,i,t] = drivers[1,i,t] * par_scale
+            out[2,i,t] = tmin
+            out[3,i,t] = vpd_value(
+                drivers[3,i,t], drivers[4,i,t], drivers[2,i,t], dtype)
+            out[4,i,t] = drivers[6,i,t]
+            # Frozen (0) where Tmin < 0, otherwise thawed (1), even if NaN
+            out[5,i,t] = zero if tmin < zero else one
+            out[6,i,t] = drivers[7,i,t]
+            out[7,i,t] = drivers[8,i,t]
+
+
+@jit(inline = 'always')
+def gpp_series(
+        fpar, par, tmin, vpd, smrz0, ft0, ft_from_tmin, smrz_min, ft_mult,
+        tmin0, tmin1, vpd0, vpd1, smrz_lo, smrz_hi, lue, out):
+    '''
+    Calculates the gross primary production (GPP) time series of a single
+    pixel; see `tcf_gpp()`. The driver data and `out` are (T,) arrays and
+    the parameters are scalars.
+    '''
+    # Constants are of the same (floating-point) type as the output, so
+    #   that float32 data are not promoted to float64
+    dtype = out.dtype.type
+    one, zero = (dtype(1), dtype(0))
+    f_offset, f_scale = (dtype(0.01), dtype(SMRZ_LOG_SCALE))
+    freezing = dtype(273.15)
+    # The reciprocal of the width of each ramp function (ramps of zero
+    #   width never use it)
+    s_scale = one / (one - smrz_min)
+    t_scale = one / (tmin1 - tmin0)
+    v_scale = one / (vpd1 - vpd0)
+    s_ramp_scale = one / (smrz_hi - smrz_lo)
+    for t in range(par.shape[0]):
+        # Rescale root-zone soil moisture, after clipping it; NaN is passed
+        #   through, as by numpy.clip()
+        smrz = smrz0[t]
+        smrz = smrz_min if smrz < smrz_min else smrz
+        smrz = one if smrz > 1 else smrz
+        smrz = ((smrz - smrz_min) * s_scale) + f_offset
+        smrz = (math.log(smrz * dtype(100)) * f_scale) + dtype(0.05)
+        # Freeze-thaw multiplier (1 when thawed)
+        if ft_from_tmin:
+            frozen = tmin[t] < freezing
+        else:
+            frozen = ft0[t] == 0
+        ft = ft_mult if frozen else one
+        # The linear ramp functions; see linear_ramp(); an NaN input fails
+        #   every comparison, so it passes through
+        x = tmin[t]
+        f_tmin = one if x >= tmin1 else (
+            zero if x < tmin0 else (x - tmin0) * t_scale)
+        x = vpd[t]
+        f_vpd = zero if x >= vpd1 else (
+            one if x < vpd0 else one - (x - vpd0) * v_scale)
+        f_smrz = one if smrz >= smrz_hi else (
+            zero if smrz < smrz_lo else (smrz - smrz_lo) * s_ramp_scale)
+        out[t] = par[t] * fpar[t] * ft * f_tmin * f_vpd * f_smrz * lue
+
+
+@jit(inline = 'always')
+def kmult_value(tsoil, smsf, tsoil_beta0, smsf0, smsf1, dtype):
+    '''
+    The environmental constraint on RH (Kmult), for scalar soil temperature
+    and soil moisture, computed in the floating-point type `dtype`; see
+    `tcf_rh()`. The parameters are constant for each pixel, so the terms
+    that depend only on them are (when inlined in a loop over time steps)
+    computed only once for each pixel.
+    '''
+    one, zero = (dtype(1), dtype(0))
+    # Soil temperature constraint; see arrhenius(); the exponent is
+    #   rearranged so that its first term is constant, and it cannot be
+    #   negative
+    t_offset = tsoil_beta0 / dtype(66.02)
+    t_mult = math.exp(t_offset - tsoil_beta0 / (tsoil - dtype(227.13)))
+    t_mult = one if t_mult > 1 else t_mult
+    # Soil moisture constraint; see linear_ramp(); an NaN input fails every
+    #   comparison, so it passes through
+    w_scale = one / (smsf1 - smsf0)
+    w_mult = one if smsf >= smsf1 else (
+        zero if smsf < smsf0 else (smsf - smsf0) * w_scale)
+    return w_mult * t_mult
+
+
+@jit(parallel = True, fastmath = FASTMATH, cache = True)
+def tcf_gpp(
+        fpar, par, tmin, vpd, smrz0, ft0, ft_from_tmin, smrz_min, ft_mult,
+        tmin0, tmin1, vpd0, vpd1, smrz_lo, smrz_hi, lue, out):
+    '''
+    Calculates gross primary production (GPP) in a single pass over the
+    driver data, for each pixel independently; see `TCF.gpp()`.
+
+    Parameters
+    ----------
+    fpar, par, tmin, vpd, smrz0, ft0 : numpy.ndarray
+        (N x T) arrays of each driver variable, as in `TCF.gpp()`
+    ft_from_tmin : bool
+        True if the freeze-thaw (FT) state is to be computed from Tmin, in
+        which case `ft0` is ignored
+    smrz_min : numpy.ndarray
+        (N,) array of the minimum root-zone soil moisture (SMRZ) of each
+        pixel, for rescaling SMRZ; see `TCF._rescale_smrz()`
+    ft_mult : numpy.ndarray
+        (N,) array of the multiplier on GPP when the soil is frozen
+    tmin0, tmin1, vpd0, vpd1, smrz_lo, smrz_hi : numpy.ndarray
+        (N,) arrays of the lower and upper bounds of the ramp functions for
+        the Tmin, VPD and (rescaled) SMRZ constraints
+    lue : numpy.ndarray
+        (N,) array of the light-use efficiency (LUE)
+    out : numpy.ndarray
+        (N x T) output array for GPP
+    '''
+    for i in prange(par.shape[0]):
+        gpp_series(
+            fpar[i], par[i], tmin[i], vpd[i], smrz0[i], ft0[i],
+            ft_from_tmin, smrz_min[i], ft_mult[i], tmin0[i], tmin1[i],
+            vpd0[i], vpd1[i], smrz_lo[i], smrz_hi[i], lue[i], out[i])
+
+
+@jit(parallel = True, fastmath = FASTMATH, cache = True)
+def tcf_gpp_kmult(
+        fpar, par, tmin, vpd, smrz0, ft0, tsoil, smsf, smrz_min, ft_mult,
+        tmin0, tmin1, vpd0, vpd1, smrz_lo, smrz_hi, lue, cue, tsoil_beta0,
+        smsf0, smsf1, gpp_out, npp_out, kmult_out):
+    '''
+    Calculates GPP, NPP and the environmental constraint on RH (Kmult) in a
+    single pass over the driver data, for each pixel independently; i.e.,
+    all of the inputs to the forward run (see `TCF._setup_forward()`) are
+    computed while each pixel's drivers are in cache. Arguments are as in
+    `tcf_gpp()`, except that the FT state is always given, and:
+
+    Parameters
+    ----------
+    tsoil, smsf : numpy.ndarray
+        (N x T) arrays of soil temperature and surface soil moisture
+    cue : numpy.ndarray
+        (N,) array of the carbon-use efficiency (CUE)
+    tsoil_beta0, smsf0, smsf1 : numpy.ndarray
+        (N,) arrays of the parameters of the RH constraints; see `tcf_rh()`
+    gpp_out, npp_out, kmult_out : numpy.ndarray
+        (N x T) output arrays for GPP, NPP and Kmult
+    '''
+    dtype = kmult_out.dtype.type
+    n, t_steps = par.shape
+    for i in prange(n):
+        gpp_series(
+            fpar[i], par[i], tmin[i], vpd[i], smrz0[i], ft0[i], False,
+            smrz_min[i], ft_mult[i], tmin0[i], tmin1[i], vpd0[i], vpd1[i],
+            smrz_lo[i], smrz_hi[i], lue[i], gpp_out[i])
+        # The parameters are loaded once, so that the compiler can hoist
+        #   the terms that depend only on them out of the loop
+        beta0, w_lo, w_hi, scale = (
+            tsoil_beta0[i], smsf0[i], smsf1[i], cue[i])
+        for t in range(t_steps):
+            npp_out[i,t] = scale * gpp_out[i,t]
+            kmult_out[i,t] = kmult_value(
+                tsoil[i,t], smsf[i,t], beta0, w_lo, w_hi, dtype)
+
+
+@jit(parallel = True, fastmath = FASTMATH, cache = True)
+def tcf_rh(
+        tsoil, smsf, soc, decay_rates, tsoil_beta0, smsf0, smsf1,
+        f_respired, out):
+    '''
+    Calculates the RH flux from each SOC pool in a single pass over the
+    driver data, for a single time step; see `TCF.rh()`. The soil
+    temperature and soil moisture constraints are computed once for each
+    pixel and shared by all three SOC pools.
+
+    Parameters
+    ----------
+    tsoil, smsf : numpy.ndarray
+        (N,) arrays of soil temperature and surface soil moisture
+    soc : numpy.ndarray
+        (3 x N) array of the SOC state
+    decay_rates : numpy.ndarray
+        (3 x N) array of the optimal decay rate of each SOC pool
+    tsoil_beta0 : numpy.ndarray
+        (N,) array of the soil temperature coefficient of the Arrhenius
+        function (the other coefficients take their default values)
+    smsf0, smsf1 : numpy.ndarray
+        (N,) arrays of the lower and upper bounds of the ramp function for
+        the soil moisture constraint
+    f_respired : numpy.ndarray
+        (N,) array of the fraction of structural pool decomposition that
+        is NOT humified, i.e., one minus `f_structural`
+    out : numpy.ndarray
+        (3 x N) output array for the RH flux from each SOC pool
+    '''
+    dtype = out.dtype.type
+    for i in prange(tsoil.shape[0]):
+        kmult = kmult_value(
+            tsoil[i], smsf[i], tsoil_beta0[i], smsf0[i], smsf1[i], dtype)
+        out[0,i] = kmult * decay_rates[0,i] * soc[0,i]
+        out[1,i] = kmult * decay_rates[1,i] * soc[1,i] * f_respired[i]
+        out[2,i] = kmult * decay_rates[2,i] * soc[2,i]
+
+
+@jit(fastmath = FASTMATH, cache = True)
+def tcf_soc_step(
+        kmult, litter, decay0, decay1, decay2, f_metabolic, f_structural,
+        soc0, soc1, soc2):
+    '''
+    Advances the SOC state of a single pixel by one time step; see
+    `tcf_forward()`.
+
+    Returns
+    -------
+    tuple
+        6-tuple of the updated SOC state of each SOC pool and the RH flux
+        from each SOC pool
+    '''
+    r0 = decay0 * kmult * soc0
+    r1 = decay1 * kmult * soc1
+    r2 = decay2 * kmult * soc2
+    # Compute SOC change
+    dc0 = (litter * f_metabolic) - r0
+    dc1 = (litter * (1 - f_metabolic)) - r1
+    dc2 = (f_structural * r1) - r2
+    # Protect against NaN contamination (NaN != NaN)
+    if dc0 == dc0:
+        soc0 += dc0
+    if dc1 == dc1:
+        soc1 += dc1
+    if dc2 == dc2:
+        soc2 += dc2
+    # Loss from the structural pool due to humification is not RH
+    r1 = r1 * (1 - f_structural)
+    return (soc0, soc1, soc2, r0, r1, r2)
+
+
+@jit(parallel = True, fastmath = FASTMATH, cache = True)
+def tcf_forward(
+        kmult, npp, litter, decay_rates, f_metabolic, f_structural,
+        soc, rh_out, nee_out, dynamic_litter):
+    '''
+    Integrates the TCF soil organic carbon (SOC) model forward in time, for
+    each pixel independently; see `TCF.forward_run()`. The SOC state of
+    each pixel is carried in registers through all T time steps and the
+    pixels are distributed across threads.
+
+    Parameters
+    ----------
+    kmult : numpy.ndarray
+        (N x T) array of the environmental constraint on RH (Kmult), i.e.,
+        the product of the soil temperature and soil moisture constraints
+    npp : numpy.ndarray
+        (N x T) array of net primary production (NPP)
+    litter : numpy.ndarray
+        (N,) array of mean daily litterfall
+    decay_rates : numpy.ndarray
+        (3 x N) array of the optimal decay rate of each SOC pool
+    f_metabolic : numpy.ndarray
+        (N,) array of the fraction of litterfall allocated to the
+        metabolic pool
+    f_structural : numpy.ndarray
+        (N,) array of the fraction of structural pool decomposition that
+        is humified (transferred to the recalcitrant pool)
+    soc : numpy.ndarray
+        (3 x N) array of the SOC state, updated in place
+    rh_out : numpy.ndarray
+        (3 x N x T) output array for the RH flux from each SOC pool
+    nee_out : numpy.ndarray
+        (N x T) output array for NEE
+    dynamic_litter : bool
+        True to set daily litterfall equal to daily NPP
+    '''
+    n, t_steps = npp.shape
+    for i in prange(n):
+        soc0 = soc[0,i]
+        soc1 = soc[1,i]
+        soc2 = soc[2,i]
+        for t in range(t_steps):
+            litter_t = npp[i,t] if dynamic_litter else litter[i]
+            soc0, soc1, soc2, r0, r1, r2 = tcf_soc_step(
+                kmult[i,t], litter_t, decay_rates[0,i], decay_rates[1,i],
+                decay_rates[2,i], f_metabolic[i], f_structural[i],
+                soc0, soc1, soc2)
+            rh_out[0,i,t] = r0
+            rh_out[1,i,t] = r1
+            rh_out[2,i,t] = r2
+            nee_out[i,t] = r0 + r1 + r2 - npp[i,t]
+        soc[0,i] = soc0
+        soc[1,i] = soc1
+        soc[2,i] = soc2
+
+
+@jit(parallel = True, fastmath = FASTMATH, cache = True)
+def tcf_spin_up(
+        kmult, npp, litter, decay_rates, f_metabolic, f_structural,
+        soc, tolerance, threshold):
+    '''
+    Repeatedly cycles a climatology through the TCF soil organic carbon
+    (SOC) model until the annual NEE sum of each pixel changes by less
+    than `threshold` from one cycle to the next; see `TCF.spin_up()`. Each
+    pixel stops cycling as soon as it has converged. Arguments are as in
+    `tcf_forward()`, except:
+
+    Parameters
+    ----------
+    tolerance : numpy.ndarray
+        (N x S) output array, for at most S climatology cycles, for the
+        change in the annual NEE sum of each pixel; it should be filled
+        with NaN, beforehand, as the values of cycles that were not run
+        are not changed
+    threshold : float
+        Threshold for (absolute) change in the annual NEE sum
+    '''
+    n, t_steps = npp.shape
+    for i in prange(n):
+        soc0 = soc[0,i]
+        soc1 = soc[1,i]
+        soc2 = soc[2,i]
+        nee_last = 0.0
+        for step in range(tolerance.shape[1]):
+            nee_sum = 0.0
+            for t in range(t_steps):
+                soc0, soc1, soc2, r0, r1, r2 = tcf_soc_step(
+                    kmult[i,t], litter[i], decay_rates[0,i],
+                    decay_rates[1,i], decay_rates[2,i], f_metabolic[i],
+                    f_structural[i], soc0, soc1, soc2)
+                nee = r0 + r1 + r2 - npp[i,t]
+                if nee == nee:
+                    nee_sum += nee
+            if step > 0:
+                tolerance[i,step] = nee_last - nee_sum
+                if abs(nee_last - nee_sum) < threshold:
+                    break
+            nee_last = nee_sum
+        soc[0,i] = soc0
+        soc[1,i] = soc1
+        soc[2,i] = soc2
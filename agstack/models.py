@@ -15,7 +15,7 @@ import numpy as np
 from numbers import Number
 from typing import Sequence
 from tqdm import tqdm
-from agstack import Namespace
+from agstack import Namespace, kernels
 from agstack.utils import arrhenius, linear_constraint, climatology365
 
 
@@ -49,11 +49,11 @@ class TCF(object):
     - Initial state of "recalcitrant" SOC pool
 
     NOTE: For developers, `self.params` refers to model parameters that have
-    been vectorized to improve performance. If a function performs
-    vectorized calculations on longitudinal (N x T) arrays, the vectorized
-    parameter(s) can be used with their current shape. For cross-sectional
-    calculations, e.g., on (N,) or (1 x N) arrays, make sure to use the
-    transpose, `self.params.name.T`, where `name` is the parameter name.
+    been vectorized to improve performance. Each is an (N,) vector, except
+    `decay_rates`, which is (3 x N). These can be used as they are for
+    cross-sectional calculations, e.g., on (N,) arrays; for longitudinal
+    calculations on (N x T) arrays, use an (N x 1) view of the parameter,
+    e.g., `self._vector(name, x)`, where `name` is the parameter name.
 
     Example use for a single pixel:
 
@@ -79,6 +79,15 @@ class TCF(object):
     litterfall : Sequence or numpy.ndarray or None
         A sequence values or 1D array representing average daily litterfall
         for each model resolution cell (pixel)
+    smrz_min : Sequence or numpy.ndarray or None
+        A sequence of values or 1D array representing the long-term minimum
+        root-zone soil moisture (SMRZ) of each model resolution cell (pixel),
+        used to rescale SMRZ; if not provided, it is computed from the
+        driver data on each call
+    dtype : numpy.dtype or type
+        The floating-point type of the parameters, state, driver data and
+        results (Default: `numpy.float32`, which halves memory traffic
+        compared to `numpy.float64` and is more precise than the drivers)
     '''
 
     required_parameters = [
@@ -101,22 +110,30 @@ class TCF(object):
 
     def __init__(
             self, params: dict, land_cover_map: Sequence,
-            state: Sequence = None, litterfall: Sequence = None
+            state: Sequence = None, litterfall: Sequence = None,
+            smrz_min: Sequence = None, dtype: np.dtype = np.float32
         ):
         self.constants = Namespace()
         self.state = Namespace()
         self.params = Namespace() # Parameters accessed, e.g., tcf.params.LUE
         self.lc_map = np.array(land_cover_map, dtype = np.uint16)
+        self.dtype = np.dtype(dtype)
+        assert np.issubdtype(self.dtype, np.floating),\
+            '"dtype" should be a floating-point type'
         # Load mean daily litterfall rates
         if litterfall is not None:
-            litterfall = np.array(litterfall, dtype = np.float32)
+            litterfall = np.array(litterfall, dtype = self.dtype)
         self.constants.add('litterfall', litterfall)
+        # Load long-term minimum root-zone soil moisture
+        if smrz_min is not None:
+            smrz_min = np.array(smrz_min, dtype = self.dtype)
+        self.constants.add('smrz_min', smrz_min)
         # Load soil organic carbon (SOC) state
         if state is not None:
             if hasattr(state, 'ndim'):
                 assert state.ndim <= 2, '"state" should have at most 2 dimensions'
             # "state" either begins as or is converted to a numpy.ndarray
-            state = np.array(state, dtype = np.float32)
+            state = np.array(state, dtype = self.dtype)
             if state.ndim == 1:
                 state = state[:,np.newaxis]
             assert len(state) == 3, 'Expected one "state" value for each SOC pool'
@@ -136,33 +153,211 @@ class TCF(object):
         for key, value in params.items():
             if key not in self.required_parameters:
                 continue
-            p_vector = np.array(value)
-            # Copy parameter values based on PFT map
+            p_vector = np.array(value, dtype = self.dtype)
+            # Copy parameter values based on PFT map; np.take() is used
+            #   rather than fancy indexing, as it is faster
+            n = self.lc_map.size
             if key == 'decay_rates':
                 if p_vector.shape == (3,):
-                    p_vector = p_vector[:,np.newaxis]\
-                        .repeat(self.lc_map.size, axis = -1)
+                    # Same decay rates everywhere: this is a read-only
+                    #   view with a zero stride, rather than N copies
+                    p_vector = np.broadcast_to(p_vector[:,np.newaxis], (3, n))
                 elif hasattr(value, 'count') and p_vector.ndim == 2:
                     # i.e., "value" was nested lists and result of converting
                     #   to a NumPy array was a (N x 3) array
-                    p_vector = p_vector.swapaxes(0, 1)[:,self.lc_map]
+                    p_vector = np.take(
+                        p_vector.swapaxes(0, 1), self.lc_map, axis = -1)
                 elif p_vector.ndim == 2:
-                    p_vector = p_vector[:,self.lc_map]
-                assert p_vector.shape == (3, self.lc_map.size)
+                    p_vector = np.take(p_vector, self.lc_map, axis = -1)
+                assert p_vector.shape == (3, n)
             else:
+                # Other parameters are used in every time step, so they are
+                #   materialized as contiguous (N,) arrays
                 if p_vector.ndim == 0:
-                    p_vector = p_vector[np.newaxis][np.newaxis]\
-                        .repeat(self.lc_map.size, axis = 0)
-                elif p_vector.ndim == 1:
-                    p_vector = p_vector.ravel()[self.lc_map]\
-                        .reshape((self.lc_map.size, 1))
-                elif p_vector.ndim == 2:
-                    p_vector = p_vector[:,self.lc_map].swapaxes(0, 1)
-            # Result should be a 2D vectorized parameter array, either:
-            #   (N x 1) or (S x N), where S is, e.g., each SOC pool
-            assert p_vector.ndim == 2
-            assert p_vector.shape[0] == self.lc_map.size or p_vector.shape[0] == 3
+                    p_vector = np.full(n, p_vector, dtype = self.dtype)
+                else:
+                    p_vector = np.take(p_vector, self.lc_map, axis = -1)
+                p_vector = np.ascontiguousarray(p_vector.ravel())
+                assert p_vector.shape == (n,)
             self.params.add(key, p_vector)
+        self._rebuild_constraints()
+
+    def _rebuild_constraints(self):
+        '''
+        Builds the environmental constraint functions and the other
+        quantities derived from the model parameters, once, so they need
+        not be re-built on every call; this must be called again after any
+        of the parameters (in `TCF.params`) are changed.
+        '''
+        # Build the (linear ramp) environmental constraint functions once;
+        #   each is a pair of functions, for cross-sectional (N,) and for
+        #   longitudinal (N x T) driver data, respectively; see
+        #   TCF._constraint()
+        self._constraints = dict()
+        for name, form in (
+                ('smsf', None), ('tmin', None), ('vpd', 'reversed'),
+                ('smrz', None)):
+            xmin = getattr(self.params, f'{name}0')
+            xmax = getattr(self.params, f'{name}1')
+            self._constraints[name] = (
+                linear_constraint(xmin, xmax, form),
+                linear_constraint(
+                    xmin[:,np.newaxis], xmax[:,np.newaxis], form))
+        # Per-pixel parameters of SOC decomposition, as (N,) vectors, or
+        #   (3 x N) for the decay rates, which are re-used at every time step
+        self._fmet = self.params.f_metabolic
+        self._f1mfmet = (1 - self._fmet)
+        self._fstruc = self.params.f_structural
+        self._f1mfstruc = (1 - self._fstruc)
+        self._d = self.params.decay_rates
+
+    def _constraint(
+            self, name: str, x: np.ndarray, out: np.ndarray = None
+        ) -> np.ndarray:
+        '''
+        Applies an environmental constraint, e.g., "smsf" for the surface
+        soil moisture constraint, to either cross-sectional (N,) or
+        longitudinal (N x T) driver data.
+
+        Parameters
+        ----------
+        name : str
+            Name of the constrained driver, as in the parameter names
+        x : numpy.ndarray
+            The driver data
+        out : numpy.ndarray or None
+            (Optional) An array to write the result to
+
+        Returns
+        -------
+        numpy.ndarray
+        '''
+        return self._constraints[name][int(np.ndim(x) > 1)](x, out = out)
+
+    def _vector(self, name: str, x: np.ndarray) -> np.ndarray:
+        '''
+        Returns the named (N,) parameter vector, as an (N x 1) view if it is
+        to be broadcast against longitudinal (N x T) data `x`.
+
+        Parameters
+        ----------
+        name : str
+            Name of the parameter
+        x : numpy.ndarray
+            The data the parameter is to be broadcast against
+
+        Returns
+        -------
+        numpy.ndarray
+        '''
+        if np.ndim(x) > 1:
+            return getattr(self.params, name)[:,np.newaxis]
+        return getattr(self.params, name)
+
+    def _forward_precomputed(
+            self, npp: np.ndarray, litter: np.ndarray, kmult: np.ndarray,
+            soc: np.ndarray, dynamic_litter: bool = False,
+            verbose: bool = True, pixels: np.ndarray = None
+        ) -> tuple:
+        '''
+        Runs the TCF model forward in time, given the quantities that
+        `TCF._setup_forward()` pre-computes; because these do not depend on
+        the SOC state, they can be re-used, e.g., by `TCF.spin_up()`. See
+        `TCF.forward_run()` for details.
+
+        Parameters
+        ----------
+        npp : numpy.ndarray
+            (T x N) array of net primary production (NPP)
+        litter : numpy.ndarray
+            (N,) array of mean daily litterfall
+        kmult : numpy.ndarray
+            (T x N) array of the environmental constraint on RH (Kmult)
+        soc : numpy.ndarray
+            (3 x N) array of the SOC state, which is updated in place
+        dynamic_litter : bool
+            True to set daily litterfall equal to daily NPP
+        verbose : bool
+            True to show a progress bar (Default: True)
+        pixels : numpy.ndarray or None
+            (Optional) Indices of the pixels that the other arguments are a
+            subset of; by default, they include all pixels
+
+        Returns
+        -------
+        tuple
+            A 2-element tuple of (NEE, RH)
+        '''
+        n_steps, n_pixels = npp.shape
+        decay = self._d
+        fmet, f1mfmet = (self._fmet, self._f1mfmet)
+        fstruc, f1mfstruc = (self._fstruc, self._f1mfstruc)
+        if pixels is not None:
+            decay = decay[:,pixels]
+            fmet, f1mfmet = (fmet[pixels], f1mfmet[pixels])
+            fstruc, f1mfstruc = (fstruc[pixels], f1mfstruc[pixels])
+        if kernels.HAS_NUMBA:
+            # The kernel integrates each pixel's time series in turn, so it
+            #   takes (N x T) arrays; see TCF._setup_forward(). Every element
+            #   of the outputs is written, so they need not be initialized
+            rh = np.empty((3, n_pixels, n_steps), dtype = self.dtype) # (3 x N x T)
+            nee = np.empty((n_pixels, n_steps), dtype = self.dtype) # (N x T)
+            kernels.tcf_forward(
+                kmult.T, npp.T, np.ravel(litter), decay, fmet, fstruc, soc,
+                rh, nee, dynamic_litter)
+            return (nee, rh)
+        # The NumPy loop writes one time step at a time, so the outputs are
+        #   allocated time-major, (T x 3 x N) and (T x N), where each step is
+        #   a contiguous block; they are returned as (3 x N x T) and (N x T)
+        #   views, as above
+        rh = np.empty((n_steps, 3, n_pixels), dtype = self.dtype)
+        nee = np.empty((n_steps, n_pixels), dtype = self.dtype)
+        # Scratch array for the change in each SOC pool, (3 x N), allocated
+        #   once and re-used at every time step; RH(t) is computed directly
+        #   in its (contiguous) block of the output
+        dc = np.empty((3, n_pixels), dtype = self.dtype)
+        # Views of each pool's row and the parameter vectors (above) are
+        #   bound to local names, once, rather than at every time step
+        dc0, dc1, dc2 = dc
+        # Unless litterfall follows NPP, the litterfall into the metabolic
+        #   and structural pools is the same at every time step
+        if not dynamic_litter:
+            litter_met = np.multiply(litter, fmet)
+            litter_str = np.multiply(litter, f1mfmet)
+        # Forward time steps
+        steps = range(0, n_steps)
+        for t in tqdm(steps, disable = not verbose):
+            if dynamic_litter:
+                # Will ensure that NPP(t) ~= RH(t) in the dynamic steady-state
+                litter = npp[t]
+                litter_met = np.multiply(litter, fmet, out = dc0)
+                litter_str = np.multiply(litter, f1mfmet, out = dc1)
+            # RH(t) from all pools at once, broadcasting Kmult(t) over pools
+            rh_t = rh[t]
+            rh0, rh1, rh2 = rh_t
+            np.multiply(decay, soc, out = rh_t)
+            rh_t *= kmult[t]
+            # Compute SOC change
+            np.subtract(litter_met, rh0, out = dc0)
+            np.subtract(litter_str, rh1, out = dc1)
+            np.multiply(fstruc, rh1, out = dc2)
+            dc2 -= rh2
+            # Protect against NaN contamination (only NaN; infinities are
+            #   passed through as before)
+            np.nan_to_num(
+                dc, copy = False, nan = 0, posinf = np.inf, neginf = -np.inf)
+            soc += dc
+            # "the adjustment...to account for material transferred into the slow
+            #   pool during humification" (Jones et al. 2017, TGARS, p.5); note
+            #   that this is a loss FROM the "medium" (structural) pool
+            rh1 *= f1mfstruc
+            # Record NEE at this time step; the sum over pools is just two
+            #   (N,) additions, in the same order as rh_t.sum(axis = 0),
+            #   without a reduction's overhead
+            np.add(rh0, rh1, out = dc0)
+            dc0 += rh2
+            np.subtract(dc0, npp[t], out = nee[t])
+        return (nee.T, rh.transpose(1, 2, 0))
 
     def _rescale_smrz(self, smrz0, smrz_min, smrz_max = 1):
         r'''
@@ -192,19 +387,23 @@ class TCF(object):
         -------
         numpy.ndarray
         '''
-        smrz_min = np.array(smrz_min)
-        if smrz_min.ndim == 1:
+        smrz_min = np.array(smrz_min, dtype = self.dtype)
+        # A site-level (N,) minimum is broadcast against (N x T) data
+        if smrz_min.ndim == 1 and np.ndim(smrz0) > 1:
             smrz_min = smrz_min[:,np.newaxis]
-        # Clip input SMRZ to the lower, upper bounds
-        smrz0 = np.where(smrz0 < smrz_min, smrz_min, smrz0)
-        smrz0 = np.where(smrz0 > smrz_max, smrz_max, smrz0)
-        smrz_norm = np.divide(
-            np.subtract(smrz0, smrz_min),
-            np.subtract(smrz_max, smrz_min)) + 0.01
+        # Clip input SMRZ to the lower, upper bounds; this is the only new
+        #   array allocated, the remaining steps are done in place
+        smrz_norm = np.clip(smrz0, smrz_min, smrz_max)
+        smrz_norm -= smrz_min
+        smrz_norm /= np.subtract(smrz_max, smrz_min)
+        smrz_norm += 0.01
         # Log-transform normalized data and rescale to range between
         #   5.0 and 100% saturation)
-        return np.add(
-            np.multiply(0.95, np.divide(np.log(smrz_norm * 100), np.log(101))), 0.05)
+        smrz_norm *= 100
+        np.log(smrz_norm, out = smrz_norm)
+        smrz_norm *= kernels.SMRZ_LOG_SCALE
+        smrz_norm += 0.05
+        return smrz_norm
 
     def _setup_forward(
             self, drivers: Sequence, state: Sequence = None,
@@ -217,24 +416,59 @@ class TCF(object):
                 'Either: "litterfall" must be provided to TCF() or "dates" must be provided at runtime'
             assert len(dates) >= 365 and drivers.shape[-1] >= 365,\
                 'At least 365 daily time steps must be provided to allow computation of annual NPP sum'
-            assert hasattr(dates[0], 'year') and hasattr(dates[0], 'strftime'),\
-                'The values of "dates" must be datetime.date or datetime.datetime instances'
-        # GPP can be computed matrix-wise, in a single time step
-        gpp = self.gpp(drivers[0:6])
-        npp = self.params.CUE * gpp
+            assert np.issubdtype(getattr(dates, 'dtype', object), np.datetime64) or (
+                    hasattr(dates[0], 'year') and hasattr(dates[0], 'toordinal')),\
+                'The values of "dates" must be datetime.date or datetime.datetime instances, or numpy.datetime64 dates'
+        # Cast the drivers to the model's type (float32, by default) once;
+        #   parameters are of the same type, so none of the calculations are
+        #   silently promoted to float64, which would double memory traffic
+        drivers = np.ascontiguousarray(drivers, dtype = self.dtype)
+        # The minimum of root-zone soil moisture (SMRZ) is used to rescale
+        #   SMRZ; unless it was provided to TCF(), it is computed from these
+        #   drivers once, here, and passed on, but never stored
+        smrz_min = self.constants.smrz_min
+        if smrz_min is None:
+            smrz_min = np.nanmin(drivers[4], axis = -1)
+        if kernels.HAS_NUMBA:
+            # GPP, NPP and Kmult (below) are computed by a compiled kernel in
+            #   a single pass over the drivers, without any temporaries
+            p = self.params
+            gpp, npp, kmult = np.empty((3, *drivers.shape[1:]), self.dtype)
+            kernels.tcf_gpp_kmult(
+                *drivers, smrz_min, p.ft0, p.tmin0, p.tmin1,
+                p.vpd0, p.vpd1, p.smrz0, p.smrz1, p.LUE, p.CUE, p.tsoil,
+                p.smsf0, p.smsf1, gpp, npp, kmult)
+        else:
+            # GPP can be computed matrix-wise, in a single time step
+            gpp = self.gpp(drivers[0:6], smrz_min = smrz_min)
+            npp = self.params.CUE[:,np.newaxis] * gpp
         # Compute litterfall from the mean annual NPP sum
         if litter is None:
             npp_sum = climatology365(npp.swapaxes(0, 1), dates).sum(axis = 0)
             # Litterfall is equal daily fraction of average annual NPP
             litter = npp_sum / 365
             self.constants.add('litterfall', litter)
-        # Pre-compute environmental constraints for soil RH
-        tsoil, smsf = drivers[-2:]
-        f_smsf = linear_constraint(self.params.smsf0, self.params.smsf1)
+        if not kernels.HAS_NUMBA:
+            # Pre-compute environmental constraints for soil RH
+            tsoil, smsf = drivers[-2:]
+            tmult = arrhenius(tsoil, self.params.tsoil[:,np.newaxis])
+            wmult = self._constraint('smsf', smsf)
+            # The combined constraint on RH (Kmult) is all that the forward
+            #   run needs, so compute it once, rather than at every time step
+            kmult = (wmult * tmult).astype(self.dtype)
         # Swap axes here only to make time the major (first) axis
-        tmult = arrhenius(tsoil, self.params.tsoil).swapaxes(0, 1)
-        wmult = f_smsf(smsf).swapaxes(0, 1)
-        return (gpp, npp, litter, tmult, wmult)
+        kmult = kmult.swapaxes(0, 1)
+        npp = npp.swapaxes(0, 1)
+        # NPP and Kmult are returned as time-major (T x N) arrays but their
+        #   memory layout depends on how they are read: the NumPy forward
+        #   run reads one time step at a time, so each kmult[t] should be a
+        #   contiguous (N,) slice, while the compiled kernel reads the whole
+        #   time series of a pixel, i.e., the (N x T) transpose should be
+        #   contiguous (which is the layout of the views created above)
+        if not kernels.HAS_NUMBA:
+            kmult = np.ascontiguousarray(kmult)
+            npp = np.ascontiguousarray(npp)
+        return (gpp, npp, litter, kmult)
 
     def diagnose_kmult(self, drivers):
         '''
@@ -265,13 +499,11 @@ class TCF(object):
             constraints
         '''
         tsoil, smsf = drivers[-2:]
-        f_smsf = linear_constraint(self.params.smsf0, self.params.smsf1)
-        # Swap axes here only to make time the major (first) axis
-        tmult = arrhenius(tsoil, self.params.tsoil)
-        wmult = f_smsf(smsf)
+        tmult = arrhenius(tsoil, self._vector('tsoil', tsoil))
+        wmult = self._constraint('smsf', smsf)
         return (tmult, wmult)
 
-    def diagnose_emult(self, drivers):
+    def diagnose_emult(self, drivers, smrz_min = None):
         '''
         Returns the environmental constraint multiplier on GPP (Emult). This
         dimensionless quantity indicates the aggregate impact of
@@ -289,29 +521,49 @@ class TCF(object):
         drivers : Sequence or numpy.ndarray
             Either a 1D sequence of P driver variables; a 2D (P x N) array for
             N pixels, or a 3D data cube of shape (P x N x T) for T time steps
+        smrz_min : numpy.ndarray or None
+            (Optional) The minimum root-zone soil moisture (SMRZ) of each
+            pixel, used to rescale SMRZ; by default, the value provided to
+            `TCF` or, if none was, the minimum of these driver data
 
         Returns
         -------
         tuple
             4-tuple of (FT, Tmin, VPD, SMRZ) environmental constraints
         '''
+        # The freeze-thaw (FT) state is only needed as a boolean mask (of
+        #   frozen soil), so no numeric FT array is created from Tmin
         if drivers.shape[0] == 5:
             fpar, par, tmin, vpd, smrz0 = drivers
-            ft0 = np.where(tmin < 273.15, 0, 1)
+            frozen = np.less(tmin, 273.15)
         else:
             fpar, par, tmin, vpd, smrz0, ft0 = drivers
-        # Rescale root-zone soil moisture
-        smrz = self._rescale_smrz(smrz0, np.nanmin(smrz0, axis = -1))
+            frozen = np.equal(ft0, 0)
+        # Rescale root-zone soil moisture, using the minimum SMRZ of each
+        #   pixel provided, if any; otherwise, the minimum of these data
+        if smrz_min is None:
+            smrz_min = self.constants.smrz_min
+        if smrz_min is None:
+            smrz_min = np.nanmin(smrz0, axis = -1)
+        smrz = self._rescale_smrz(smrz0, smrz_min)
+        # All four constraints are written into a single buffer, rather than
+        #   allocating (several) temporary arrays for each one
+        ft0_param = self._vector('ft0', tmin)
+        emult = np.empty(
+            (4, *np.broadcast_shapes(np.shape(tmin), ft0_param.shape)),
+            dtype = self.dtype)
         # Convert freeze-thaw flag to a multiplier (always 1 when thawed but
-        #   potentially non-zero and less than 1 when thawed)
-        ft = np.where(ft0 == 0, self.params.ft0, 1)
-        # Get a function that constrains each met. driver to [0, 1]
-        f_tmin = linear_constraint(self.params.tmin0, self.params.tmin1)(tmin)
-        f_vpd = linear_constraint(
-            self.params.vpd0, self.params.vpd1, 'reversed')(vpd)
-        f_smrz = linear_constraint(self.params.smrz0, self.params.smrz1)(smrz)
+        #   potentially non-zero and less than 1 when frozen); this is a
+        #   masked store, rather than an arithmetic blend, so that it is
+        #   exactly 1 when thawed
+        emult[0] = 1
+        np.copyto(emult[0], ft0_param, where = frozen)
+        # Constrain each met. driver to [0, 1]
+        self._constraint('tmin', tmin, out = emult[1])
+        self._constraint('vpd', vpd, out = emult[2])
+        self._constraint('smrz', smrz, out = emult[3])
         # Compute the environmental constraint
-        return (ft, f_tmin, f_vpd, f_smrz)
+        return tuple(emult)
 
     def forward_run(
             self, drivers: Sequence, state: Sequence = None,
@@ -322,8 +574,11 @@ class TCF(object):
         Runs the TCF model forward in time for daily time steps. This is the
         recommended interface for most users. If `litterfall` was not provided
         to `TCF` at initialization, it will be necessary to provide at least
-        365 daily steps and the `years` of each time step. Order of driver
-        variables should be:
+        365 daily steps and the `years` of each time step. Litterfall, if
+        computed from the drivers, is stored in `TCF.constants` and re-used
+        by later runs; the minimum root-zone soil moisture of each pixel, if
+        not provided to `TCF`, is computed from the drivers on each call.
+        Order of driver variables should be:
 
             Fraction of PAR intercepted (fPAR) [0-1]
             Photosynthetically active radation (PAR) [MJ m-2 day-1]
@@ -335,7 +590,10 @@ class TCF(object):
             Surface soil moisture wetness, volume proportion [0-1]
 
         GPP calculation is vectorized but RH and NEE calculation proceed
-        step-wise because they depend on the model state (SOC).
+        step-wise because they depend on the model state (SOC). If `numba`
+        is installed, the step-wise calculation is done by a compiled kernel
+        that runs pixels in parallel; otherwise, by a loop over time steps
+        in NumPy. No progress bar is shown for the compiled kernel.
 
         Parameters
         ----------
@@ -344,11 +602,12 @@ class TCF(object):
             N pixels, or a 3D data cube of shape (P x N x T) for T time steps
         state : Sequence or numpy.ndarray or None
             A sequence of 3 values or an (3 x N) array representing the
-            SOC state in each SOC pool
+            SOC state in each SOC pool; an array is updated in place
         dates : Sequence or numpy.ndarray or None
             If `litterfall` was not provided to `TCF` during initialization,
-            you must provide a sequence of `datetime.date` instances, of length
-            T for T time steps, indicating the current year of each time step.
+            you must provide a sequence of `datetime.date` instances (or an
+            array of `numpy.datetime64` dates), of length T for T time steps,
+            indicating the current year of each time step.
         dynamic_litter : bool
             TCF assumes that litterfall is an equal daily fraction of the
             annual NPP sum. This can lead to an imbalance between RH and NPP,
@@ -369,37 +628,20 @@ class TCF(object):
         soc = state
         if soc is None:
             soc = self.state.soc
-        gpp, npp, litter, tmult, wmult = self._setup_forward(drivers, state, dates)
-        # Pre-allocate output arrays
-        rh = np.ones((3, *gpp.shape), dtype = np.float32) # (3 x N x T)
-        nee = np.ones((*gpp.shape,), dtype = np.float32) # (N x T)
-        # Forward time steps
-        steps = range(0, drivers.shape[-1])
-        for t in tqdm(steps, disable = not verbose):
-            if dynamic_litter:
-                # Will ensure that NPP(t) ~= RH(t) in the dynamic steady-state
-                litter = npp[...,t]
-            rh_t = np.empty((3, litter.shape[0])) # Allocate RH(t) array
-            for pool in range(0, soc.shape[0]):
-                rh_t[pool] = self.params.decay_rates[pool] *\
-                    wmult[t] * tmult[t] * soc[pool]
-            # Compute SOC change
-            dc1 = (litter * self.params.f_metabolic.T) - rh_t[0,...]
-            dc2 = (litter * (1 - self.params.f_metabolic.T)) - rh_t[1,...]
-            dc3 = (self.params.f_structural.T * rh_t[1,...]) - rh_t[2,...]
-            for i, delta in enumerate([dc1, dc2, dc3]):
-                delta[np.isnan(delta)] = 0 # Protect against NaN contamination
-                soc[i] += delta[0]
-            # "the adjustment...to account for material transferred into the slow
-            #   pool during humification" (Jones et al. 2017, TGARS, p.5); note
-            #   that this is a loss FROM the "medium" (structural) pool
-            rh_t[1,...] = rh_t[1,...] * (1 - self.params.f_structural.T)
-            # Record RH and NEE at this time step
-            rh[...,t] = rh_t
-            nee[...,t] = rh_t.sum(axis = 0) - npp[...,t]
+        # The SOC state is updated in place, in the model's type; a state of
+        #   another type is updated as a cast copy, which is written back
+        soc_in = soc
+        soc = np.ascontiguousarray(soc_in, dtype = self.dtype)
+        gpp, npp, litter, kmult = self._setup_forward(drivers, state, dates)
+        nee, rh = self._forward_precomputed(
+            npp, litter, kmult, soc, dynamic_litter, verbose)
+        if soc is not soc_in and isinstance(soc_in, np.ndarray):
+            np.copyto(soc_in, soc)
         return (nee, gpp, rh)
 
-    def gpp(self, drivers: Sequence) -> np.ndarray:
+    def gpp(
+            self, drivers: Sequence, smrz_min: Sequence = None
+        ) -> np.ndarray:
         '''
         Calculates gross primary production (GPP) under prevailing climatic
         climatic conditions. Order of driver variables should be:
@@ -426,6 +668,10 @@ class TCF(object):
         drivers : Sequence or numpy.ndarray
             Either a 1D sequence of P driver variables; a 2D (P x N) array for
             N pixels, or a 3D data cube of shape (P x N x T) for T time steps
+        smrz_min : Sequence or numpy.ndarray or None
+            (Optional) The minimum root-zone soil moisture (SMRZ) of each
+            pixel, used to rescale SMRZ; by default, the value provided to
+            `TCF` or, if none was, the minimum of these driver data
 
         Returns
         -------
@@ -433,13 +679,38 @@ class TCF(object):
             Gross primary production (GPP) in [g C m-2 time-1] where time is
             the time step of the PAR data, e.g., [g C m-2 day-1]
         '''
+        # A C-ordered data cube is already a "structure of arrays," i.e.,
+        #   each driver variable is a contiguous (N x T) block that can be
+        #   read with unit stride; other layouts are copied, once, here
+        drivers = np.ascontiguousarray(drivers)
         if drivers.shape[0] == 5:
-            fpar, par, _, _, _ = drivers
+            fpar, par, tmin, vpd, smrz0 = drivers
+            ft0 = tmin
         else:
-            fpar, par, _, _, _, _ = drivers
-        ft, f_tmin, f_vpd, f_smrz = self.diagnose_emult(drivers)
-        emult = ft * f_tmin * f_vpd * f_smrz
-        return par * fpar * emult * self.params.LUE
+            fpar, par, tmin, vpd, smrz0, ft0 = drivers
+        if kernels.HAS_NUMBA and drivers.ndim == 3:
+            # For longitudinal data, the compiled kernel computes GPP in a
+            #   single pass, without allocating any (N x T) temporaries
+            if smrz_min is None:
+                smrz_min = self.constants.smrz_min
+            if smrz_min is None:
+                smrz_min = np.nanmin(smrz0, axis = -1)
+            p = self.params
+            gpp = np.empty(par.shape, dtype = np.result_type(par, fpar))
+            kernels.tcf_gpp(
+                fpar, par, tmin, vpd, smrz0, ft0, drivers.shape[0] == 5,
+                np.asarray(smrz_min, dtype = self.dtype), p.ft0, p.tmin0,
+                p.tmin1, p.vpd0, p.vpd1, p.smrz0, p.smrz1, p.LUE, gpp)
+            return gpp
+        ft, f_tmin, f_vpd, f_smrz = self.diagnose_emult(
+            drivers, smrz_min = smrz_min)
+        # Accumulate the product (PAR x fPAR x Emult x LUE) in place, so that
+        #   only one (N x T) array is allocated
+        gpp = np.multiply(par, fpar)
+        for multiplier in (
+                ft, f_tmin, f_vpd, f_smrz, self._vector('LUE', gpp)):
+            gpp *= multiplier
+        return gpp
 
     def rh(
             self, drivers: Sequence, state: Sequence = None
@@ -481,16 +752,28 @@ class TCF(object):
         if soc is None:
             soc = self.state.soc
         tsoil, smsf = drivers # Unpack met. drivers
-        # Take transpose of parameter vectors here because the driver datasets
-        #   are cross-sectional; i.e., smsf and tsoil are 1D vectors
-        f_smsf = linear_constraint(self.params.smsf0.T, self.params.smsf1.T)
-        tmult = arrhenius(tsoil, self.params.tsoil.T)
-        wmult = f_smsf(smsf)
-        rh = wmult * tmult * self.params.decay_rates * soc
+        if kernels.HAS_NUMBA and np.ndim(tsoil) == 1 and np.ndim(soc) == 2:
+            # A compiled kernel computes all three fluxes in a single pass,
+            #   without any temporary arrays
+            p = self.params
+            tsoil, smsf, soc = map(np.ascontiguousarray, (tsoil, smsf, soc))
+            rh = np.empty(
+                soc.shape, dtype = np.result_type(tsoil, smsf, soc, self._d))
+            kernels.tcf_rh(
+                tsoil, smsf, soc, self._d, p.tsoil, p.smsf0, p.smsf1,
+                self._f1mfstruc, rh)
+            return rh
+        # The driver datasets are cross-sectional; i.e., smsf and tsoil are
+        #   1D vectors, so the parameter vectors can be used as they are
+        kmult = self._constraint('smsf', smsf)
+        kmult *= arrhenius(tsoil, self.params.tsoil)
+        # The (3 x N) result is the only full-size array allocated
+        rh = np.multiply(kmult, self._d)
+        rh *= soc
         # "the adjustment...to account for material transferred into the slow
         #   pool during humification" (Jones et al. 2017, TGARS, p.5); note
         #   that this is a loss FROM the "medium" (structural) pool
-        rh[1,...] = rh[1,...] * (1 - self.params.f_structural.T)
+        rh[1] *= self._f1mfstruc
         return rh
 
     def spin_up(
@@ -501,18 +784,25 @@ class TCF(object):
         '''
         Repeatedly cycle climatology until SOC state reaches equilibrium. See
         `TCF.forward_run()` for details on `drivers` and `state` arguments.
+        The `drivers` are cycled as they are given, so they should already be
+        a climatology, e.g., from `agstack.utils.climatology365()`.
+
+        Each pixel stops cycling as soon as its own annual NEE sum has
+        converged, so that its spin-up does not depend on other pixels. If
+        `numba` is installed, the pixels are spun-up in parallel by a
+        compiled kernel, and no progress is shown.
 
         Parameters
         ----------
         dates : Sequence or numpy.ndarray
-            A sequence of `datetime.date` instances, of length T for T time
-            steps
+            A sequence of `datetime.date` instances, or an array of
+            `numpy.datetime64` dates, of length T for T time steps
         drivers : Sequence or numpy.ndarray
             Either a 1D sequence of P driver variables; a 2D (P x N) array for
             N pixels, or a 3D data cube of shape (P x N x T) for T time steps
         state : Sequence or numpy.ndarray or None
             A sequence of 3 values or an (3 x N) array representing the
-            SOC state in each SOC pool
+            SOC state in each SOC pool; an array is updated in place
         max_steps : int
             Maximum number of climatology cycles (365-day years) to apply
             (Default: 100)
@@ -533,25 +823,49 @@ class TCF(object):
         soc = state
         if soc is None:
             soc = self.state.soc
-        clim = []
-        for each in drivers:
-            clim.append(
-                climatology365(each.swapaxes(0, 1), dates).swapaxes(0, 1))
-        tolerance = np.nan * np.ones((soc.shape[-1], max_steps), np.float32)
+        # The SOC state is updated in place, in the model's type; a state of
+        #   another type is updated as a cast copy, which is written back
+        soc_in = soc
+        soc = np.ascontiguousarray(soc_in, dtype = self.dtype)
+        tolerance = np.nan * np.ones((soc.shape[-1], max_steps), self.dtype)
         disable = (not verbose or not verbose_type == 'tqdm')
+        # GPP, litterfall and the constraints on RH don't depend on the SOC
+        #   state, so they need only be computed once
+        _, npp, litter, kmult = self._setup_forward(drivers, soc, dates)
+        if kernels.HAS_NUMBA:
+            # Each pixel is spun-up independently and stops as soon as it
+            #   has converged, rather than when all pixels have converged
+            kernels.tcf_spin_up(
+                kmult.T, npp.T, np.ravel(litter), self._d, self._fmet,
+                self._fstruc, soc, tolerance, threshold)
+            if soc is not soc_in and isinstance(soc_in, np.ndarray):
+                np.copyto(soc_in, soc)
+            return tolerance
+        # Only the pixels that have not yet converged are cycled; the
+        #   subsets of the (T x N) inputs are taken only when that changes
+        active = np.arange(soc.shape[-1])
+        litter = np.ravel(litter)
+        inputs = (npp, litter, kmult, soc)
         for step in tqdm(range(0, max_steps), disable = disable):
-            nee, gpp, rh = self.forward_run(drivers, soc, dates, verbose = False)
+            nee, _ = self._forward_precomputed(
+                *inputs, verbose = False, pixels = active)
+            soc[:,active] = inputs[-1] # Write back the SOC state
             # Diagnostics
             # rh_sum = rh.sum(axis = 0).sum(axis = -1)
             # npp_sum = (gpp * self.params.CUE).sum(axis = -1)
             nee_sum = np.nansum(nee, axis = -1)
-            if step == 0:
-                nee_last = nee_sum
-            else:
-                tolerance[:,step] = (nee_last - nee_sum)
-                nee_last = nee_sum
-                if (np.abs(tolerance[:,step]) < threshold).all():
+            if step > 0:
+                tolerance[active,step] = (nee_last - nee_sum)
+                converged = np.abs(tolerance[active,step]) < threshold
+                if converged.any():
+                    active = active[~converged]
+                    nee_sum = nee_sum[~converged]
+                    inputs = (
+                        npp[:,active], litter[active], kmult[:,active],
+                        soc[:,active])
+                if active.size == 0:
                     break
+            nee_last = nee_sum
             # Diagnostics
             # rh_track[:,step] = rh_sum
             # npp_track[:,step] = npp_sum
@@ -560,4 +874,92 @@ class TCF(object):
                 print(
                     'Change in annual NEE sum [SOC state]: %.2f, [%.0f]' %
                     (np.nanmean(tolerance[:,step]), self.state.soc.sum()))
+        if soc is not soc_in and isinstance(soc_in, np.ndarray):
+            np.copyto(soc_in, soc)
         return tolerance
+
+    def spin_up_analytic(
+            self, dates: Sequence, drivers: Sequence, state: Sequence = None
+        ) -> np.ndarray:
+        r'''
+        Solves directly for the SOC state that is in equilibrium with the
+        climatology, i.e., the state that `TCF.spin_up()` converges to,
+        without iterating. See `TCF.forward_run()` for details on `drivers`
+        and `state` arguments.
+
+        The daily SOC update is linear in the SOC state, \(C\):
+
+        $$
+        C_{t+1} = A_t\, C_t + b_t
+        $$
+
+        Where \(A_t\) is a (3 x 3) matrix of the (Kmult-scaled) decay of each
+        pool and of the transfer between pools, and \(b_t\) is the
+        litterfall allocated to each pool. Composing the T daily updates
+        yields an update over the whole climatology, \(C' = M\, C + c\),
+        and the equilibrium SOC state solves \((I - M)\, C = c\). Because
+        \(M\) is lower-triangular, this is solved by forward substitution,
+        for each pixel.
+
+        Parameters
+        ----------
+        dates : Sequence or numpy.ndarray
+            A sequence of `datetime.date` instances, or an array of
+            `numpy.datetime64` dates, of length T for T time steps
+        drivers : Sequence or numpy.ndarray
+            Either a 1D sequence of P driver variables; a 2D (P x N) array for
+            N pixels, or a 3D data cube of shape (P x N x T) for T time steps
+        state : Sequence or numpy.ndarray or None
+            A sequence of 3 values or an (3 x N) array representing the
+            SOC state in each SOC pool; it is overwritten with the
+            equilibrium state, except for any pixel that has no equilibrium
+            because its SOC never decays (i.e., Kmult is zero or missing on
+            every day), which is left unchanged
+
+        Returns
+        -------
+        numpy.ndarray
+            The (3 x N) equilibrium SOC state
+        '''
+        soc = state
+        if soc is None:
+            soc = self.state.soc
+        _, _, litter, kmult = self._setup_forward(drivers, soc, dates)
+        litter = np.ravel(litter).astype(np.float64)
+        k0, k1, k2 = self._d.astype(np.float64)
+        # Parameters of the SOC update, bound to locals (in double precision)
+        #   once, rather than looked up and cast at every time step
+        fmet, f1mfmet, fstruc_k1 = (
+            self._fmet.astype(np.float64), self._f1mfmet.astype(np.float64),
+            self._fstruc.astype(np.float64) * k1)
+        # Non-zero entries of the composite (lower-triangular) operator, M,
+        #   and the composite litterfall input, c
+        m00, m11, m21, m22 = (
+            np.ones(litter.shape), np.ones(litter.shape),
+            np.zeros(litter.shape), np.ones(litter.shape))
+        c0, c1, c2 = (np.zeros(litter.shape) for i in range(0, 3))
+        for t in range(0, kmult.shape[0]):
+            # A NaN in the drivers means no change in SOC on that day, as in
+            #   the forward run, i.e., A_t is the identity and b_t is zero
+            valid = ~np.isnan(kmult[t])
+            k_t = np.where(valid, kmult[t], 0)
+            a0, a1, a2 = (1 - k0 * k_t), (1 - k1 * k_t), (1 - k2 * k_t)
+            humified = fstruc_k1 * k_t
+            lit_t = np.where(valid, litter, 0)
+            # Apply this day's update to the composite: M <- A_t M and
+            #   c <- A_t c + b_t
+            m21 = humified * m11 + a2 * m21
+            m00, m11, m22 = a0 * m00, a1 * m11, a2 * m22
+            c2 = humified * c1 + a2 * c2
+            c0 = a0 * c0 + lit_t * fmet
+            c1 = a1 * c1 + lit_t * f1mfmet
+        # A pixel where Kmult is zero (or NaN) on every day, e.g., because
+        #   SMSF never exceeds "smsf0", has no SOC decay and, therefore, no
+        #   equilibrium (I - M is singular); its state is left unchanged
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            eq1 = c1 / (1 - m11)
+            eq = np.stack((
+                c0 / (1 - m00), eq1, (c2 + m21 * eq1) / (1 - m22)))
+        solved = np.isfinite(eq).all(axis = 0)
+        soc[:,solved] = eq[:,solved]
+        return soc
@@ -6,6 +6,10 @@ import numpy as np
 import warnings
 from numbers import Number
 from typing import Callable, Sequence
+from agstack import kernels
+
+# The proleptic Gregorian ordinal of 1970-01-01, the epoch of numpy.datetime64
+UNIX_EPOCH_ORDINAL = 719163
 
 def arrhenius(
         tsoil: Number, beta0: float, beta1: float = 66.02,
@@ -36,6 +40,12 @@ def arrhenius(
     numpy.ndarray
         Array of soil temperatures mapped through the Arrhenius function
     '''
+    if kernels.HAS_NUMBA:
+        # A compiled ufunc computes (and constrains) the result in a single
+        #   pass, without any temporary arrays; NaNs in the drivers are
+        #   expected, so the (FP status) warnings they raise are ignored
+        with np.errstate(invalid = 'ignore'):
+            return kernels.arrhenius(tsoil, beta0, beta1, beta2)
     a = (1.0 / beta1)
     b = np.divide(1.0, np.subtract(tsoil, beta2))
     # This is the simple answer, but it takes on values >1
@@ -58,8 +68,9 @@ def climatology365(
     ----------
     series : numpy.ndarray
         T x ... array of data
-    dates : list or tuple
-        Sequence of datetime.datetime or datetime.date instances
+    dates : list or tuple or numpy.ndarray
+        Sequence of datetime.datetime or datetime.date instances, or an
+        array of numpy.datetime64 dates
     ignore_leap : bool
         True to convert DOY to (DOY-1) in leap years, effectively ignoring
         Leap Day (Default); if False, DOY numbers are unchanged
@@ -73,20 +84,23 @@ def climatology365(
             np.nanmean(x[ordinal == day,...], axis = 0)
             for day in range(1, 366)
         ])
-    # Get first and last day of the year (DOY)
-    ordinal = np.array([
-        # Finally, subtract 1 from each day in a leap year after Leap Day
-        (doy - 1) if (
-            ignore_leap and (dates[i].year % 4 == 0) and doy >= 60) else doy
-        for i, doy in enumerate([
-            # Next, fill in 0 wherever Leap Day occurs
-            0 if (dates[i].year % 4 == 0 and doy == 60) else doy
-            for i, doy in enumerate([
-                # First, convert datetime.datetime to ordinal day-of-year (DOY)
-                int(dt.strftime('%j')) for dt in dates
-            ])
-        ])
-    ])
+    # Convert the dates to ordinal day-of-year (DOY), all at once; Python
+    #   dates are converted via their (proleptic Gregorian) ordinals, as
+    #   NumPy's conversion of date objects is much slower
+    days = dates
+    if not np.issubdtype(getattr(dates, 'dtype', object), np.datetime64):
+        days = np.fromiter(
+            (dt.toordinal() for dt in dates), dtype = np.int64,
+            count = len(dates)) - UNIX_EPOCH_ORDINAL
+    days = days.astype('datetime64[D]')
+    years = days.astype('datetime64[Y]')
+    doy = (days - years).astype(int) + 1
+    leap = (years.astype(int) + 1970) % 4 == 0
+    # Fill in 0 wherever Leap Day occurs; then, subtract 1 from each day in
+    #   a leap year after Leap Day
+    ordinal = np.where(np.logical_and(leap, doy == 60), 0, doy)
+    if ignore_leap:
+        ordinal[np.logical_and(leap, doy > 60)] -= 1
     with warnings.catch_warnings():
         warnings.simplefilter('ignore')
         return calc_climatology(series)
@@ -119,14 +133,42 @@ def linear_constraint(
     Returns
     -------
     function
+        A function of `x` and, optionally, `out`, an array to write the
+        result to (except for the "binary" form)
     '''
     assert form == 'binary' or np.any(xmax >= xmin),\
         'xmax must be greater than/ equal to xmin'
-    if form == 'reversed':
-        return lambda x: np.where(x >= xmax, 0,
-            np.where(x < xmin, 1, 1 - np.divide(
-                x - xmin, xmax - xmin)))
     if form == 'binary':
         return lambda x: np.where(x == 1, xmax, xmin)
-    return lambda x: np.where(x >= xmax, 1,
-        np.where(x < xmin, 0, np.divide(x - xmin, xmax - xmin)))
+    ramp = np.subtract(xmax, xmin)
+    # A degenerate ramp (xmin == xmax) is a step function, but the
+    #   normalized value (x - xmin) / (xmax - xmin) would be undefined at
+    #   x == xmax, which should map to 1
+    degenerate = np.any(ramp == 0)
+    # The slope of the ramp is computed once, so that each call multiplies
+    #   rather than divides
+    with np.errstate(divide = 'ignore'):
+        slope = np.divide(1, ramp)
+
+    def constraint(x, out = None):
+        if kernels.HAS_NUMBA:
+            ufunc = kernels.ramp
+            if form == 'reversed':
+                ufunc = kernels.ramp_reversed
+            with np.errstate(invalid = 'ignore'):
+                return ufunc(x, xmin, xmax, out = out)
+        x = np.asarray(x)
+        if out is None:
+            out = np.empty(
+                np.broadcast_shapes(x.shape, np.shape(xmin)),
+                dtype = np.result_type(x, xmin, np.float32))
+        y = np.subtract(x, xmin, out = out)
+        with np.errstate(invalid = 'ignore'):
+            np.multiply(y, slope, out = y)
+        np.clip(y, 0, 1, out = y)
+        if degenerate:
+            np.copyto(y, 1, where = np.greater_equal(x, xmax))
+        if form == 'reversed':
+            np.subtract(1, y, out = y)
+        return y
+    return constraint
@@ -2,13 +2,151 @@
 Unit tests for file interchange and driver data functions.
 '''
 
+import datetime
 import os
+import numpy as np
+import pytest
 import agstack
-from agstack.io import drivers_from_csv
+from agstack.drivers import (
+    drivers_for_tcf, par_from_shortwave, vapor_pressure_deficit)
+from agstack.io import (
+    drivers_from_csv, params_dict_from_json, params_dict_from_npz,
+    params_dict_to_npz)
 
 CLIM_FILE = os.path.join(os.path.dirname(agstack.__file__), 'data/example_climatology_US-Ne3.csv')
+BPLUT = os.path.join(os.path.dirname(agstack.__file__), 'data/SPL4CMDL_V7_BPLUT.json')
 
 def test_drivers_from_csv():
     drivers, dates = drivers_from_csv(
         CLIM_FILE, fields_diff = ('swrad', 'ps', 'qv2m', 'tmean'))
-    assert drivers.shape == (9, 365)
+    assert drivers.shape == (9, 365) and drivers.dtype == np.float32
+    assert drivers.flags['C_CONTIGUOUS']
+    # Fields not in the file (e.g., "swrad") are NaN; others (e.g., "fpar")
+    #   are read as they are
+    assert np.isnan(drivers[1]).all()
+    assert drivers[0,0] == np.float32(0.067) and drivers[-1,0] == np.float32(0.570)
+
+
+def test_drivers_for_tcf():
+    np.random.seed(406)
+    shape = (3, 365)
+    drivers = np.stack([
+        np.random.uniform(0, 1, shape), # fPAR
+        np.random.uniform(0, 300, shape), # SWGDN
+        np.random.uniform(250, 300, shape), # Tmean
+        np.random.uniform(0.001, 0.02, shape), # QV2M
+        np.random.uniform(8e4, 1e5, shape), # PS
+        np.random.uniform(240, 290, shape), # Tmin
+        np.random.uniform(0, 1, shape), # SMRZ
+        np.random.uniform(250, 300, shape), # Tsoil
+        np.random.uniform(0, 1, shape), # SMSF
+    ], axis = 0)
+    result = drivers_for_tcf(drivers)
+    assert result.shape == (8, 3, 365) and result.dtype == np.float64
+    assert np.equal(result[1], par_from_shortwave(drivers[1])).all()
+    assert np.equal(
+        result[3], vapor_pressure_deficit(*drivers[[3,4,2]])).all()
+    for i, j in ((0, 0), (2, 5), (4, 6), (6, 7), (7, 8)):
+        assert np.equal(result[i], drivers[j]).all()
+    assert np.equal(result[5], np.where(drivers[5] < 0, 0, 1)).all()
+    # A single pixel gets a pixel axis; float32 drivers stay float32
+    result = drivers_for_tcf(drivers[:,0].astype(np.float32))
+    assert result.shape == (8, 1, 365) and result.dtype == np.float32
+    # Surface soil moisture (SMSF) out of bounds is only caught if validated
+    drivers[8,0,0] = 1.5
+    with pytest.raises(AssertionError):
+        drivers_for_tcf(drivers)
+    assert drivers_for_tcf(drivers, validate = False)[7,0,0] == 1.5
+
+
+def test_drivers_for_tcf_kernel_matches_numpy(monkeypatch):
+    '''
+    Test that the single-pass drivers kernel agrees with the NumPy
+    implementation, including for NaNs and for a single pixel.
+    '''
+    np.random.seed(406)
+    lower = (0, 0, 250, 0.001, 8e4, 240, 0, 250, 0)
+    upper = (1, 300, 300, 0.02, 1e5, 290, 1, 300, 1)
+    drivers = np.stack([
+        np.random.uniform(a, b, (3, 365)) for a, b in zip(lower, upper)
+    ], axis = 0)
+    drivers[5] -= 273.15 # Some Tmin below zero, for the FT state
+    drivers[5,1,10:20] = np.nan
+    drivers[2,2,30:40] = np.nan
+    for inputs in (drivers, drivers[:,0].astype(np.float32)):
+        results = []
+        for has_numba in (True, False):
+            monkeypatch.setattr(agstack.kernels, 'HAS_NUMBA', has_numba)
+            results.append(drivers_for_tcf(inputs, validate = False))
+        assert results[0].shape == results[1].shape
+        assert results[0].dtype == results[1].dtype == inputs.dtype
+        assert np.allclose(
+            *results, rtol = 1e-5, atol = 0.01, equal_nan = True)
+
+
+def test_par_from_shortwave():
+    swrad = np.array([0, 150, 300])
+    assert np.equal(par_from_shortwave(swrad).round(3), [0, 5.832, 11.664]).all()
+    out = np.empty(3, dtype = np.float32)
+    assert par_from_shortwave(swrad, out = out) is out
+
+
+def test_vapor_pressure_deficit():
+    qv2m = np.array([0.002, 0.008, 0.015])
+    ps = np.array([101325, 95000, 85000])
+    temp_k = np.array([263.15, 288.15, 303.15])
+    vpd = vapor_pressure_deficit(qv2m, ps, temp_k).round(2)
+    assert np.equal(vpd, [-39.5, 488.47, 2211.13]).all()
+    # Scalar inputs give a scalar result; inputs are broadcast
+    assert round(vapor_pressure_deficit(0.008, 95000, 288.15), 2) == 488.47
+    assert vapor_pressure_deficit(qv2m[:,None], 95000, temp_k).shape == (3, 3)
+
+
+def test_vapor_pressure_deficit_kernel_matches_numpy(monkeypatch):
+    '''
+    Test that the compiled VPD ufunc agrees with the NumPy implementation,
+    including for NaNs and for float32 inputs.
+    '''
+    np.random.seed(406)
+    qv2m = np.random.uniform(0.001, 0.02, (10, 365))
+    ps = np.random.uniform(8e4, 1.05e5, (10, 365))
+    temp_k = np.random.uniform(240, 315, (10, 365))
+    temp_k[2,100:110] = np.nan
+    # Without numba, the "compiled" ufunc is a numpy.vectorize() of plain
+    #   Python, which always returns float64
+    compiled = agstack.kernels.HAS_NUMBA
+    for dtype in (np.float32, np.float64):
+        inputs = [x.astype(dtype) for x in (qv2m, ps, temp_k)]
+        results = []
+        for has_numba in (True, False):
+            monkeypatch.setattr(agstack.kernels, 'HAS_NUMBA', has_numba)
+            results.append(vapor_pressure_deficit(*inputs))
+        assert results[1].dtype == dtype
+        assert results[0].dtype == dtype or not compiled
+        assert np.allclose(*results, rtol = 1e-4, atol = 0.1, equal_nan = True)
+
+
+def test_drivers_from_csv_with_dates(tmp_path):
+    file_path = tmp_path / 'drivers.csv'
+    file_path.write_text(
+        'date,fpar,tmin\n2023-01-01,0.1,270.5\n2023-01-02,0.2,271.5\n')
+    drivers, dates = drivers_from_csv(str(file_path), dtype = np.float64)
+    assert drivers.shape == (9, 2) and drivers.dtype == np.float64
+    assert np.equal(drivers[[0,5]], [[0.1, 0.2], [270.5, 271.5]]).all()
+    assert list(dates) == [
+        datetime.datetime(2023, 1, 1), datetime.datetime(2023, 1, 2)]
+    file_path.write_text('date,fpar\n2023-01-01T12:30:00,0.1\n')
+    _, dates = drivers_from_csv(str(file_path))
+    assert dates[0] == datetime.datetime(2023, 1, 1, 12, 30)
+
+
+def test_params_dict_npz_round_trip(tmp_path):
+    params = params_dict_from_json(BPLUT)
+    file_path = str(tmp_path / 'params.npz')
+    params_dict_to_npz(params, file_path)
+    result = params_dict_from_npz(file_path)
+    assert result.keys() == params.keys()
+    assert result['_version'] == params['_version']
+    for key, value in params.items():
+        if key != '_version':
+            assert np.array_equal(result[key], value, equal_nan = True)
@@ -37,31 +37,33 @@ def random_tcf_data_cube(
         np.random.randint(128, 6569, n_pixels),
     ], axis = 0)
     size = n_pixels * t_steps
+    # Each field is drawn into its row of the (final) data cube, rather than
+    #   being stacked afterwards
+    drivers = np.empty((8, size))
+    fpar, par, tmin, vpd, smrz, ft, tsoil, smsf = drivers
     # Assumed Gaussian distributions based on mean, std. deviation of
-    #   SMAP Level 4 Carbon, Version 7 inputs
-    fpar = np.random.normal(0.46, 0.24, size)
-    fpar = np.where(np.logical_or(fpar < 0, fpar > 1), 0, fpar)
-    par = np.random.normal(6.8, 3.9, size)
-    par = np.where(par < 0, 0, par)
-    tmin = np.random.normal(278.5, 12.3, size)
-    vpd = np.random.lognormal(5.4, 1.4, size)
-    smrz = np.random.normal(0.77, 0.15, size)
-    smrz = np.where(np.logical_or(smrz < 0, smrz > 1), 0, smrz)
-    ft = np.random.choice((0, 1), size)
-    tsoil = np.random.normal(284, 10, size)
-    smsf = np.random.normal(0.50, 0.21, size)
-    smsf = np.where(np.logical_or(smsf < 0, smsf > 1), 0, smsf)
+    #   SMAP Level 4 Carbon, Version 7 inputs; values out of bounds are set
+    #   to zero, in place
+    fpar[:] = np.random.normal(0.46, 0.24, size)
+    fpar[np.logical_or(fpar < 0, fpar > 1)] = 0
+    par[:] = np.random.normal(6.8, 3.9, size)
+    np.maximum(par, 0, out = par)
+    tmin[:] = np.random.normal(278.5, 12.3, size)
+    vpd[:] = np.random.lognormal(5.4, 1.4, size)
+    smrz[:] = np.random.normal(0.77, 0.15, size)
+    smrz[np.logical_or(smrz < 0, smrz > 1)] = 0
+    ft[:] = np.random.choice((0, 1), size)
+    tsoil[:] = np.random.normal(284, 10, size)
+    smsf[:] = np.random.normal(0.50, 0.21, size)
+    smsf[np.logical_or(smsf < 0, smsf > 1)] = 0
+    drivers = drivers.reshape((8, n_pixels, t_steps))
     if seasonal_cycle and t_steps >= 365:
-        cycle = np.sin((np.pi * np.arange(t_steps)) / 365)[None,:]\
-            .repeat(n_pixels, axis = 0)
-        fpar = (fpar.reshape((n_pixels, t_steps)) * cycle).ravel()
-        tmin = 273.15 + (
-            (tmin.reshape((n_pixels, t_steps)) - 273.15) * cycle).ravel()
-        tsoil = 273.15 + (
-            (tsoil.reshape((n_pixels, t_steps)) - 273.15) * cycle).ravel()
-    drivers = np.stack([
-        fpar, par, tmin, vpd, smrz, ft, tsoil, smsf
-    ], axis = 0).reshape((8, n_pixels, t_steps))
+        cycle = np.sin((np.pi * np.arange(t_steps)) / 365)
+        drivers[0] *= cycle
+        for k in (2, 6): # Tmin and Tsoil
+            drivers[k] -= 273.15
+            drivers[k] *= cycle
+            drivers[k] += 273.15
     return soc, drivers
 
 
@@ -95,6 +97,47 @@ def test_tcf_forward_run_values():
                   [ 182,101, 6039]])).all()
 
 
+def test_tcf_forward_run_float64():
+    '''
+    Test that the TCF model can be run in double precision, which agrees
+    with the default (single) precision.
+    '''
+    soc_state, drivers = random_tcf_data_cube(
+        10, 365, seed = 406, seasonal_cycle = True)
+    pft = [0] * 10
+    results = []
+    for dtype in (np.float32, np.float64):
+        tcf = TCF(
+            CEREAL_PARAMETERS, pft, state = soc_state,
+            litterfall = [2.0] * 10, dtype = dtype)
+        nee, gpp, rh = tcf.forward_run(drivers, verbose = False)
+        assert nee.dtype == gpp.dtype == rh.dtype == dtype
+        assert tcf.state.soc.dtype == dtype
+        results.append(tcf.state.soc)
+    assert np.allclose(*results, rtol = 1e-4)
+
+
+def test_tcf_forward_run_state_of_another_type():
+    '''
+    Test that a SOC state of another type than the model's is accepted and
+    updated in place, as a state of the model's type is.
+    '''
+    soc_state, drivers = random_tcf_data_cube(10, 365, seed = 406)
+    tcf = TCF(CEREAL_PARAMETERS, [0] * 10, litterfall = [2.0] * 10)
+    soc32 = soc_state.astype(np.float32)
+    soc64 = soc_state.astype(np.float64)
+    nee32, _, _ = tcf.forward_run(drivers, state = soc32, verbose = False)
+    nee64, _, _ = tcf.forward_run(drivers, state = soc64, verbose = False)
+    assert soc64.dtype == np.float64
+    assert np.array_equal(nee32, nee64)
+    assert np.array_equal(soc32, soc64)
+    soc64 = soc_state.astype(np.float64)
+    tcf.spin_up(None, drivers, state = soc64, verbose = False)
+    soc32 = soc_state.astype(np.float32)
+    tcf.spin_up(None, drivers, state = soc32, verbose = False)
+    assert np.array_equal(soc32, soc64)
+
+
 def test_tcf_spin_up_values():
     '''
     Test that the TCF model's spin-up calculations are consistent.
@@ -111,6 +154,72 @@ def test_tcf_spin_up_values():
     assert (np.nanmin(np.abs(tolerance), axis = -1) < 1).all()
 
 
+def test_tcf_spin_up_datetime64_dates():
+    '''
+    Test that the TCF model's spin-up accepts dates as a numpy.datetime64
+    array, with the same results as for datetime.date instances.
+    '''
+    soc_state, drivers = random_tcf_data_cube(
+        10, 365, seed = 406, seasonal_cycle = True)
+    dates = [
+        datetime.date(2023, 1, 1) + datetime.timedelta(days = d)
+        for d in range(0, 365)
+    ]
+    dates64 = np.arange(
+        np.datetime64('2023-01-01'), np.datetime64('2024-01-01'))
+    pft = [0] * 10
+    tcf = TCF(CEREAL_PARAMETERS, pft, state = soc_state.copy())
+    tolerance = tcf.spin_up(dates, drivers, verbose = False)
+    tcf64 = TCF(CEREAL_PARAMETERS, pft, state = soc_state.copy())
+    tolerance64 = tcf64.spin_up(dates64, drivers, verbose = False)
+    assert np.array_equal(tolerance, tolerance64, equal_nan = True)
+    assert np.array_equal(tcf.state.soc, tcf64.state.soc)
+
+
+def test_tcf_spin_up_analytic_values():
+    '''
+    Test that the TCF model's analytical spin-up finds the steady state,
+    i.e., that a forward run of the climatology doesn't change SOC.
+    '''
+    soc_state, drivers = random_tcf_data_cube(
+        10, 365, seed = 406, seasonal_cycle = True)
+    dates = [
+        datetime.date(2023, 1, 1) + datetime.timedelta(days = d)
+        for d in range(0, 365)
+    ]
+    pft = [0] * 10
+    tcf = TCF(CEREAL_PARAMETERS, pft, state = soc_state)
+    soc = tcf.spin_up_analytic(dates, drivers).copy()
+    assert (soc > 0).all()
+    tcf.forward_run(drivers, dates = dates, verbose = False)
+    assert np.allclose(tcf.state.soc, soc, rtol = 1e-4)
+
+
+def test_tcf_spin_up_analytic_without_equilibrium():
+    '''
+    Test that the TCF model's analytical spin-up leaves unchanged the state
+    of a pixel whose SOC never decays, i.e., a pixel that is too dry all
+    year or that has no valid driver data.
+    '''
+    soc_state, drivers = random_tcf_data_cube(
+        10, 365, seed = 406, seasonal_cycle = True)
+    dates = [
+        datetime.date(2023, 1, 1) + datetime.timedelta(days = d)
+        for d in range(0, 365)
+    ]
+    pft = [0] * 10
+    expected = TCF(CEREAL_PARAMETERS, pft, state = soc_state)
+    expected.spin_up_analytic(dates, drivers)
+    drivers[-1,0] = 0 # SMSF at or below "smsf0" all year
+    drivers[:,1] = np.nan
+    tcf = TCF(CEREAL_PARAMETERS, pft, state = soc_state)
+    with np.errstate(divide = 'raise', invalid = 'raise'):
+        soc = tcf.spin_up_analytic(dates, drivers)
+    assert np.isfinite(soc).all()
+    assert np.array_equal(soc[:,0:2], soc_state[:,0:2].astype(np.float32))
+    assert np.array_equal(soc[:,2:], expected.state.soc[:,2:])
+
+
 def test_tcf_gpp_values_1d():
     '''
     Test that the TCF model's GPP calculation is consistent for a single
@@ -169,6 +278,66 @@ def test_tcf_gpp_with_l4c_parameters():
     assert gpp.max() == 24.85
 
 
+def test_tcf_gpp_cross_sectional():
+    '''
+    Test that the TCF model's GPP calculation on a single time slice, i.e.,
+    a (P x N) array, returns one value for each pixel.
+    '''
+    soc_state, drivers = random_tcf_data_cube(100, 365, seed = 406)
+    pft = np.random.choice([0, 1], size = 100)
+    params = dict(
+        zip(CEREAL_PARAMETERS.keys(),
+        zip(CEREAL_PARAMETERS.values(), BROADLEAF_PARAMETERS.values())))
+    tcf = TCF(params, pft, soc_state)
+    assert tcf.params.LUE.shape == (100,)
+    assert tcf.params.decay_rates.shape == (3, 100)
+    gpp = tcf.gpp(drivers[0:6][...,0])
+    assert gpp.shape == (100,)
+    assert np.all(gpp >= 0)
+
+
+def test_tcf_gpp_with_smrz_min():
+    '''
+    Test that providing the minimum root-zone soil moisture of each pixel
+    gives the same GPP as computing it from the drivers.
+    '''
+    soc_state, drivers = random_tcf_data_cube(100, 365, seed = 406)
+    pft = [0] * 100
+    gpp0 = TCF(CEREAL_PARAMETERS, pft).gpp(drivers[0:6])
+    tcf = TCF(
+        CEREAL_PARAMETERS, pft, smrz_min = drivers[4].min(axis = -1))
+    assert tcf.constants.smrz_min.shape == (100,)
+    assert np.array_equal(tcf.gpp(drivers[0:6]), gpp0)
+
+
+def test_tcf_smrz_min_computed_on_each_call():
+    '''
+    Test that, without a minimum root-zone soil moisture provided, a model
+    run on two data cubes with different minima gives the same results as
+    two new models.
+    '''
+    soc_state, drivers = random_tcf_data_cube(10, 365, seed = 406)
+    wet = drivers.copy()
+    wet[4] = np.maximum(wet[4], 0.5)
+    dry = drivers.copy()
+    dry[4] *= 0.5
+    pft = [0] * 10
+    tcf = TCF(
+        CEREAL_PARAMETERS, pft, state = soc_state.copy(),
+        litterfall = [2.0] * 10)
+    for cube in (wet, dry):
+        expected = TCF(
+            CEREAL_PARAMETERS, pft, state = tcf.state.soc.copy(),
+            litterfall = [2.0] * 10)
+        nee1, gpp1, rh1 = expected.forward_run(cube, verbose = False)
+        nee0, gpp0, rh0 = tcf.forward_run(cube, verbose = False)
+        assert tcf.constants.smrz_min is None
+        assert np.array_equal(gpp0, gpp1)
+        assert np.array_equal(nee0, nee1)
+        assert np.array_equal(rh0, rh1)
+        assert np.array_equal(tcf.gpp(cube[0:6]), expected.gpp(cube[0:6]))
+
+
 def test_tcf_rh_values_1d():
     '''
     Test that the TCF model's RH calculation is consistent for a single
@@ -227,3 +396,121 @@ def test_tcf_rh_with_l4c_parameters():
     assert np.var(rh).round(2) == 0.39
     assert rh.min() == 0.0
     assert rh.max() == 2.88
+
+
+def test_tcf_forward_run_kernel_matches_numpy(monkeypatch):
+    '''
+    Test that the compiled forward-run kernel agrees with the NumPy
+    implementation; without `numba`, the kernel runs as plain Python.
+    '''
+    soc_state, drivers = random_tcf_data_cube(
+        10, 365, seed = 406, seasonal_cycle = True)
+    drivers[-1,2,100:110] = np.nan # Check that NaNs are handled the same
+    params = dict(
+        zip(CEREAL_PARAMETERS.keys(),
+        zip(CEREAL_PARAMETERS.values(), BROADLEAF_PARAMETERS.values())))
+    pft = np.random.choice([0, 1], size = 10)
+    results = []
+    for has_numba in (True, False):
+        monkeypatch.setattr(agstack.kernels, 'HAS_NUMBA', has_numba)
+        tcf = TCF(params, pft, state = soc_state, litterfall = [2.0] * 10)
+        results.append(
+            (*tcf.forward_run(drivers, dynamic_litter = True, verbose = False),
+            tcf.state.soc))
+    for kernel_result, numpy_result in zip(*results):
+        assert np.allclose(
+            kernel_result, numpy_result, rtol = 1e-4, atol = 1e-4,
+            equal_nan = True)
+
+
+def test_tcf_spin_up_kernel_matches_numpy(monkeypatch):
+    '''
+    Test that the compiled spin-up kernel agrees with the NumPy
+    implementation, including which pixels stop cycling, and when.
+    '''
+    soc_state, drivers = random_tcf_data_cube(
+        10, 365, seed = 406, seasonal_cycle = True)
+    dates = [
+        datetime.date(2023, 1, 1) + datetime.timedelta(days = d)
+        for d in range(0, 365)
+    ]
+    results = []
+    for has_numba in (True, False):
+        monkeypatch.setattr(agstack.kernels, 'HAS_NUMBA', has_numba)
+        tcf = TCF(CEREAL_PARAMETERS, [0] * 10, state = soc_state)
+        tolerance = tcf.spin_up(
+            dates, drivers, max_steps = 100, verbose = False)
+        results.append((tolerance, tcf.state.soc))
+    assert np.array_equal(
+        np.isnan(results[0][0]), np.isnan(results[1][0]))
+    for kernel_result, numpy_result in zip(*results):
+        assert np.allclose(
+            kernel_result, numpy_result, rtol = 1e-3, atol = 1e-2,
+            equal_nan = True)
+
+
+def test_tcf_gpp_kernel_matches_numpy(monkeypatch):
+    '''
+    Test that the compiled GPP kernel agrees with the NumPy implementation,
+    with or without the FT state, and that NaNs are handled the same.
+    '''
+    _, drivers = random_tcf_data_cube(10, 365, seed = 406)
+    for p in range(0, 5):
+        drivers[p,p,100:110] = np.nan
+    params = dict(
+        zip(CEREAL_PARAMETERS.keys(),
+        zip(CEREAL_PARAMETERS.values(), BROADLEAF_PARAMETERS.values())))
+    pft = np.random.choice([0, 1], size = 10)
+    for n_drivers in (5, 6):
+        results = []
+        for has_numba in (True, False):
+            monkeypatch.setattr(agstack.kernels, 'HAS_NUMBA', has_numba)
+            tcf = TCF(params, pft)
+            results.append(tcf.gpp(drivers[0:n_drivers]))
+        assert np.array_equal(np.isnan(results[0]), np.isnan(results[1]))
+        assert np.allclose(
+            *results, rtol = 1e-4, atol = 1e-4, equal_nan = True)
+
+
+def test_tcf_rh_kernel_matches_numpy(monkeypatch):
+    '''
+    Test that the compiled RH kernel agrees with the NumPy implementation,
+    for both precisions of the driver data, and that NaNs are handled the
+    same.
+    '''
+    _, drivers = random_tcf_data_cube(10, 1, seed = 407)
+    drivers = drivers[-2:,:,0]
+    drivers[0,2] = np.nan
+    drivers[1,5] = np.nan
+    params = dict(
+        zip(CEREAL_PARAMETERS.keys(),
+        zip(CEREAL_PARAMETERS.values(), BROADLEAF_PARAMETERS.values())))
+    pft = np.random.choice([0, 1], size = 10)
+    for dtype in (np.float32, np.float64):
+        results = []
+        for has_numba in (True, False):
+            monkeypatch.setattr(agstack.kernels, 'HAS_NUMBA', has_numba)
+            tcf = TCF(params, pft, state = np.full((3, 10), 100, np.float32))
+            results.append(tcf.rh(drivers.astype(dtype)))
+        assert results[0].dtype == results[1].dtype
+        assert np.array_equal(np.isnan(results[0]), np.isnan(results[1]))
+        assert np.allclose(*results, rtol = 1e-5, equal_nan = True)
+
+
+def test_tcf_rebuild_constraints(monkeypatch):
+    '''
+    Test that, after the parameters are changed and the constraints are
+    re-built, the model agrees with a new model of the changed parameters.
+    '''
+    soc_state, drivers = random_tcf_data_cube(10, 1, seed = 406)
+    params = dict(CEREAL_PARAMETERS)
+    changed = dict(params, smsf1 = 0.5, f_structural = 0.3)
+    for has_numba in (True, False):
+        monkeypatch.setattr(agstack.kernels, 'HAS_NUMBA', has_numba)
+        tcf = TCF(params, [0] * 10, soc_state)
+        tcf.params.add('smsf1', np.full(10, 0.5, np.float32))
+        tcf.params.add('f_structural', np.full(10, 0.3, np.float32))
+        tcf._rebuild_constraints()
+        expected = TCF(changed, [0] * 10, soc_state)
+        assert np.array_equal(
+            tcf.rh(drivers[-2:,:,0]), expected.rh(drivers[-2:,:,0]))
@@ -2,7 +2,6 @@
 Tests using or against the `pyl4c` library.
 '''
 
-import csv
 import datetime
 import os
 import numpy as np
@@ -26,14 +25,8 @@ def test_tcf_clim_cycle():
     for key in ('smsf0', 'smsf1', 'smrz0', 'smrz1'):
         params[key] /= 100 # Convert from [%] to proportion
     soc_state = [173.6, 130.7, 2159.4] # Vv7042 state on April 1, 2015
-    drivers = []
-    with open(CLIM_FILE, 'r') as file:
-        reader = csv.reader(file)
-        for line in reader:
-            if reader.line_num == 1:
-                continue
-            drivers.append(list(map(float, line)))
-    drivers = np.stack(drivers, axis = -1)[:,np.newaxis,:]
+    drivers = np.loadtxt(CLIM_FILE, delimiter = ',', skiprows = 1)
+    drivers = drivers.T[:,np.newaxis,:]
     dates = [
         datetime.date(2023, 1, 1) + datetime.timedelta(days = d)
         for d in range(0, 365)